@@ -19,6 +19,7 @@ if config.config_file_name is not None:
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from app.accounts.models import *
+from app.balance.models import *
 from app.auth.models import *
 from app.base.models import *
 from sqlmodel import SQLModel
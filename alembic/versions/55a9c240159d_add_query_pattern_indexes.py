@@ -0,0 +1,42 @@
+"""add query pattern indexes
+
+Revision ID: 55a9c240159d
+Revises: ec35bc17b1e7
+Create Date: 2026-10-17 03:48:58.344748
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '55a9c240159d'
+down_revision: Union[str, None] = 'ec35bc17b1e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # built concurrently so writes to these tables are not blocked meanwhile, which cannot run in a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_authjs_session_session_token'), 'session', ['session_token'], unique=False,
+                        schema='authjs', postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_account_owner_id_is_merchant_name', 'account', ['owner_id', 'is_merchant', 'name'],
+                        unique=False, schema='core', postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_core_transaction_entry_transaction_id'), 'transaction_entry', ['transaction_id'],
+                        unique=False, schema='core', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_core_transaction_entry_transaction_id'), table_name='transaction_entry', schema='core',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_account_owner_id_is_merchant_name', table_name='account', schema='core',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_authjs_session_session_token'), table_name='session', schema='authjs',
+                      postgresql_concurrently=True, if_exists=True)
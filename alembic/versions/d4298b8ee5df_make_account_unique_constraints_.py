@@ -0,0 +1,38 @@
+"""Make account unique constraints deferrable
+
+Revision ID: d4298b8ee5df
+Revises: 990830ad3e0c
+Create Date: 2026-10-17 03:37:22.827258
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4298b8ee5df'
+down_revision: Union[str, None] = '990830ad3e0c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # not detected by autogenerate, so recreated by hand
+    op.drop_constraint('uniq_owner_name', 'account', schema='core', type_='unique')
+    op.create_unique_constraint('uniq_owner_name', 'account', ['owner_id', 'name'], schema='core',
+                                deferrable=True, initially='IMMEDIATE')
+    op.drop_constraint('uniq_account_mask', 'account_user', schema='core', type_='unique')
+    op.create_unique_constraint('uniq_account_mask', 'account_user', ['account_id', 'mask'], schema='core',
+                                deferrable=True, initially='IMMEDIATE')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uniq_account_mask', 'account_user', schema='core', type_='unique')
+    op.create_unique_constraint('uniq_account_mask', 'account_user', ['account_id', 'mask'], schema='core')
+    op.drop_constraint('uniq_owner_name', 'account', schema='core', type_='unique')
+    op.create_unique_constraint('uniq_owner_name', 'account', ['owner_id', 'name'], schema='core')
@@ -0,0 +1,67 @@
+"""Store amounts as cents
+
+Revision ID: e54b3fcabe98
+Revises: 55a9c240159d
+Create Date: 2026-10-17 04:03:31.831797
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e54b3fcabe98'
+down_revision: Union[str, None] = '55a9c240159d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+AMOUNT_TABLES = ('transaction', 'transaction_entry', 'transaction_fingerprint')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in AMOUNT_TABLES:
+        op.alter_column(table, 'amount',
+                   existing_type=sa.DOUBLE_PRECISION(precision=53),
+                   type_=sa.BigInteger(),
+                   existing_nullable=False,
+                   postgresql_using='round(amount * 100)::bigint',
+                   schema='core')
+
+    # rounding sums could leave them a cent off from the rounded entries, so they are summed again
+    op.execute("""
+        UPDATE core.transaction t SET amount = e.amount
+        FROM (SELECT transaction_id, sum(amount) AS amount
+              FROM core.transaction_entry
+              WHERE amount > 0
+              GROUP BY transaction_id) e
+        WHERE e.transaction_id = t.id AND e.amount <> t.amount
+    """)
+
+    op.alter_column('daily_balance', 'amount',
+               existing_type=sa.DOUBLE_PRECISION(precision=53),
+               type_=sa.BigInteger(),
+               existing_nullable=False,
+               postgresql_using='round(amount * 100)::bigint',
+               schema='core')
+    op.execute("""
+        UPDATE core.daily_balance b SET amount = e.amount
+        FROM (SELECT account_user_id, date, sum(amount) AS amount
+              FROM core.transaction_entry
+              GROUP BY account_user_id, date) e
+        WHERE e.account_user_id = b.account_user_id AND e.date = b.date AND e.amount <> b.amount
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in AMOUNT_TABLES + ('daily_balance',):
+        op.alter_column(table, 'amount',
+                   existing_type=sa.BigInteger(),
+                   type_=sa.DOUBLE_PRECISION(precision=53),
+                   existing_nullable=False,
+                   postgresql_using='amount / 100.0',
+                   schema='core')
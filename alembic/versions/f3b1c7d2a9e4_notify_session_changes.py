@@ -0,0 +1,42 @@
+"""Notify session changes
+
+Revision ID: f3b1c7d2a9e4
+Revises: e54b3fcabe98
+Create Date: 2026-10-17 05:12:44.218306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b1c7d2a9e4'
+down_revision: Union[str, None] = 'e54b3fcabe98'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # same as created along with `authjs.session` by `app.auth.models`
+    op.execute("""
+        CREATE OR REPLACE FUNCTION authjs.notify_session_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('adfire_session_changed', OLD.session_token);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER notify_session_change AFTER UPDATE OR DELETE ON authjs.session
+        FOR EACH ROW EXECUTE FUNCTION authjs.notify_session_change()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER notify_session_change ON authjs.session')
+    op.execute('DROP FUNCTION authjs.notify_session_change()')
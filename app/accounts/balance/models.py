@@ -1,5 +1,7 @@
+from datetime import date
+
 from app.accounts.models import AccountUserRead, AccountRead
-from app.base.models import TimeSeries
+from app.base.models import TimeSeries, Money
 
 
 class AccountUserBalanceRead(AccountUserRead):
@@ -8,4 +10,14 @@ class AccountUserBalanceRead(AccountUserRead):
 
 class AccountBalanceRead(AccountRead):
     balances: list[TimeSeries]
-    users: list[AccountUserBalanceRead]
\ No newline at end of file
+    users: list[AccountUserBalanceRead]
+
+
+class AccountUserBalanceAsOfRead(AccountUserRead):
+    balance: Money
+
+
+class AccountBalanceAsOfRead(AccountRead):
+    as_of: date
+    balance: Money
+    users: list[AccountUserBalanceAsOfRead]
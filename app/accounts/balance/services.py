@@ -1,34 +1,37 @@
-from operator import attrgetter
+from datetime import date
 
-from sqlalchemy.orm import selectinload
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.accounts.balance.models import AccountBalanceRead, AccountUserBalanceRead
-from app.accounts.models import Account, AccountUser
+from app.accounts.balance.models import AccountBalanceRead, AccountUserBalanceRead, AccountBalanceAsOfRead, \
+    AccountUserBalanceAsOfRead
+from app.accounts.models import AccountUser
 from app.accounts.services import get_account_by_id_stmt
 from app.auth.models import AuthUser
-from app.transactions.services import aggregate_entries
+from app.base.models import Granularity, Cents
+from app.transactions.services import get_balance_series, get_balance_series_by_account_user, \
+    get_balance_as_of_by_account_user
 
 
-def get_account_balance(
-        db: Session,
+async def get_account_balance(
+        db: AsyncSession,
         auth_user: AuthUser,
         id: str,
-        include_merchants: bool = False
+        include_merchants: bool = False,
+        start: date | None = None,
+        end: date | None = None,
+        granularity: Granularity = 'day',
 ) -> AccountBalanceRead:
     stmt = get_account_by_id_stmt(auth_user, id, include_merchants)
-    stmt = stmt.options(
-        selectinload(Account.users)
-        .selectinload(AccountUser.entries)
-    )
 
-    account = db.exec(stmt).one()
-    account_balances = aggregate_entries(e for users in account.users for e in users.entries)
+    account = (await db.exec(stmt)).one()
+    window = dict(start=start, end=end, granularity=granularity)
+    account_balances = await get_balance_series(db, AccountUser.account_id == account.id, **window)
+    user_balances = await get_balance_series_by_account_user(db, AccountUser.account_id == account.id, **window)
     users = [AccountUserBalanceRead(
         id=u.pub_id,
         name=u.name,
         mask=u.mask,
-        balances=aggregate_entries(e for e in u.entries)
+        balances=user_balances.get(u.id, [])
     ) for u in account.users]
 
     return AccountBalanceRead(
@@ -38,3 +41,31 @@ def get_account_balance(
         balances=account_balances,
         users=users
     )
+
+
+async def get_account_balance_as_of(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        id: str,
+        as_of: date,
+        include_merchants: bool = False,
+) -> AccountBalanceAsOfRead:
+    stmt = get_account_by_id_stmt(auth_user, id, include_merchants)
+
+    account = (await db.exec(stmt)).one()
+    user_balances = await get_balance_as_of_by_account_user(db, AccountUser.account_id == account.id, as_of=as_of)
+    users = [AccountUserBalanceAsOfRead(
+        id=u.pub_id,
+        name=u.name,
+        mask=u.mask,
+        balance=Cents(user_balances.get(u.id, 0))
+    ) for u in account.users]
+
+    return AccountBalanceAsOfRead(
+        id=account.pub_id,
+        name=account.name,
+        is_merchant=account.is_merchant,
+        as_of=as_of,
+        balance=Cents(sum(u.balance for u in users)),
+        users=users
+    )
@@ -2,7 +2,7 @@ from typing import Self
 
 from nanoid import generate
 from pydantic import model_validator
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint
 from sqlalchemy.orm import declared_attr
 from sqlmodel import Field, Relationship
 
@@ -30,7 +30,10 @@ class Account(CoreBase, table=True):
     @declared_attr
     def __table_args__(cls):
         return table_args(cls, (
-            UniqueConstraint('owner_id', 'name', name='uniq_owner_name'),
+            # deferrable so a bulk upsert can swap names between accounts within its transaction
+            UniqueConstraint('owner_id', 'name', name='uniq_owner_name', deferrable=True, initially='IMMEDIATE'),
+            # serves listings of an owner's accounts, with or without merchants, in name order
+            Index('ix_account_owner_id_is_merchant_name', 'owner_id', 'is_merchant', 'name'),
         ))
 
 
@@ -51,7 +54,7 @@ class AccountUser(CoreBase, table=True):
     @declared_attr
     def __table_args__(cls):
         return table_args(cls, (
-            UniqueConstraint('account_id', 'mask', name='uniq_account_mask'),
+            UniqueConstraint('account_id', 'mask', name='uniq_account_mask', deferrable=True, initially='IMMEDIATE'),
         ))
 
 
@@ -97,3 +100,16 @@ class AccountUserRead(AccountUserUpdate):
 class AccountRead(AccountUpdate):
     id: str
     users: list[AccountUserRead]
+
+
+class AccountBulkUpdate(AccountBase):
+    # duplicate masks are reported per item by the bulk upsert rather than failing the whole body
+    id: str
+    users: list[AccountUserUpdate]
+
+
+class AccountBulkResult(RouteBase):
+    index: int
+    created: bool = False
+    account: AccountRead | None = None
+    error: str | None = None
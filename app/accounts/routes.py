@@ -1,27 +1,39 @@
-from fastapi import APIRouter, Response
+from datetime import date
+from typing import Annotated
+
+from fastapi import APIRouter, Response, Body, Depends
+from fastapi.params import Query
+from starlette.responses import JSONResponse
 from starlette.status import HTTP_201_CREATED
 
-from app.accounts.balance.models import AccountBalanceRead
-from app.accounts.balance.services import get_account_balance
-from app.accounts.models import AccountRead, AccountCreate, AccountUpdate
-from app.accounts.services import get_all_accounts, get_account_by_id, create_account, delete_account, \
-    upsert_account
-from app.deps import DBSessionDep, AuthUserDep
+from app.accounts.balance.models import AccountBalanceRead, AccountBalanceAsOfRead
+from app.accounts.balance.services import get_account_balance, get_account_balance_as_of
+from app.accounts.models import AccountRead, AccountCreate, AccountUpdate, AccountBulkUpdate, AccountBulkResult
+from app.accounts.services import get_all_accounts_json, get_account_by_id, create_account, delete_account, \
+    upsert_account, upsert_accounts
+from app.balance.services import get_cached_balance
+from app.base.models import Granularity
+from app.deps import check_data_version, DBSessionDep, AuthUserDep, DataVersionDep
+from app.timing import TimedRoute
 
 router = APIRouter(
     prefix='/accounts',
-    tags=['accounts']
+    tags=['accounts'],
+    dependencies=[Depends(check_data_version)],
+    route_class=TimedRoute,
 )
 
 
-@router.get('/')
+@router.get('/', response_model=list[AccountRead])
 async def get_all(
         db: DBSessionDep,
         auth_user: AuthUserDep,
+        response: Response,
         include_merchants: bool = False,
-) -> list[AccountRead]:
+) -> JSONResponse:
     """Returns all accounts from `auth_user`."""
-    return get_all_accounts(db, auth_user, include_merchants)
+    # returned as is, so headers set on `response` by dependencies are passed on here
+    return JSONResponse(await get_all_accounts_json(db, auth_user, include_merchants), headers=response.headers)
 
 
 @router.get('/{id}')
@@ -32,7 +44,7 @@ async def get(
         include_merchants: bool = False,
 ) -> AccountRead:
     """Returns account with `id` from `auth_user`."""
-    return get_account_by_id(db, auth_user, id, include_merchants)
+    return await get_account_by_id(db, auth_user, id, include_merchants)
 
 
 @router.post('/', status_code=HTTP_201_CREATED)
@@ -43,11 +55,21 @@ async def create(
         response: Response,
 ) -> AccountRead:
     """Creates a new account for `auth_user`."""
-    data = create_account(db, auth_user, body)
+    data = await create_account(db, auth_user, body)
     response.headers['Location'] = f'{router.prefix}/{data.id}'
     return data
 
 
+@router.put('/bulk')
+async def upsert_bulk(
+        db: DBSessionDep,
+        auth_user: AuthUserDep,
+        body: Annotated[list[AccountBulkUpdate], Body(max_length=1_000)],
+) -> list[AccountBulkResult]:
+    """Upserts many accounts for `auth_user` at once, returning the account or conflict of each in order."""
+    return await upsert_accounts(db, auth_user, body)
+
+
 @router.put('/{id}')
 async def upsert(
         db: DBSessionDep,
@@ -57,7 +79,7 @@ async def upsert(
         response: Response,
 ) -> AccountRead:
     """Upserts `body` to account with `id` for `auth_user`."""
-    data, is_created = upsert_account(db, auth_user, id, body)
+    data, is_created = await upsert_account(db, auth_user, id, body)
 
     if not is_created:
         return data
@@ -74,14 +96,30 @@ async def delete(
         id: str,
 ):
     """Deletes account with `id` from `auth_user`."""
-    delete_account(db, auth_user, id)
+    await delete_account(db, auth_user, id)
 
 
 @router.get('/{id}/balance')
 async def get_balances(
         db: DBSessionDep,
         auth_user: AuthUserDep,
+        version: DataVersionDep,
         id: str,
-) -> AccountBalanceRead:
-    """Returns account with `id` including its balance series from `auth_user`."""
-    return get_account_balance(db, auth_user, id)
+        start: date | None = Query(None, alias='from'),
+        end: date | None = Query(None, alias='to'),
+        granularity: Granularity = 'day',
+        as_of: date | None = Query(None, alias='asOf'),
+) -> AccountBalanceRead | AccountBalanceAsOfRead:
+    """
+    Returns account with `id` including its balance series from `auth_user` between `from` and `to`,
+    with one point per `granularity` bucket. Cumulative values include activity before `from`.
+
+    With `asOf`, returns only the balances at the end of that day instead.
+    """
+    if as_of:
+        return await get_cached_balance(auth_user, version, ('account_as_of', id, as_of),
+                                        lambda: get_account_balance_as_of(db, auth_user, id, as_of))
+
+    return await get_cached_balance(auth_user, version, ('account_series', id, start, end, granularity),
+                                    lambda: get_account_balance(db, auth_user, id, start=start, end=end,
+                                                                granularity=granularity))
@@ -1,8 +1,17 @@
-from sqlalchemy import SelectBase
-from sqlmodel import select, Session
+from itertools import groupby
+from operator import itemgetter
 
-from app.accounts.models import Account, AccountRead, AccountUserRead, AccountCreate, AccountUser, AccountUpdate
+from nanoid import generate
+from sqlalchemy import SelectBase, or_, and_, insert, update, delete, text
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.accounts.models import Account, AccountRead, AccountUserRead, AccountCreate, AccountUser, AccountUpdate, \
+    AccountBulkUpdate, AccountBulkResult
 from app.auth.models import AuthUser
+from app.balance.rollup import delete_account_users_rollup
+from app.base.versions import bump_data_version
 
 
 def map_account(account: Account) -> AccountRead:
@@ -18,26 +27,53 @@ def map_account(account: Account) -> AccountRead:
     )
 
 
-def get_all_accounts(db: Session, auth_user: AuthUser, include_merchants: bool = False) -> list[AccountRead]:
+async def get_all_accounts(db: AsyncSession, auth_user: AuthUser, include_merchants: bool = False) -> list[AccountRead]:
     stmt = (select(Account)
             .order_by(Account.name)
+            .options(selectinload(Account.users))
             .where(Account.owner_id == auth_user.id))
 
     if not include_merchants:
         stmt = stmt.where(Account.is_merchant == False)
 
-    accounts = db.exec(stmt).all()
+    accounts = (await db.exec(stmt)).all()
 
     return [map_account(a) for a in accounts]
 
 
-def get_account_users_pub_id_to_id_map(db: Session, auth_user: AuthUser, ids: list[str]) -> dict[str, str]:
+async def get_all_accounts_json(db: AsyncSession, auth_user: AuthUser, include_merchants: bool = False) -> list[dict]:
+    """
+    Same as `get_all_accounts`, but selects plain columns in one query and maps them straight to
+    dicts shaped like serialized `AccountRead`, skipping ORM and pydantic instances.
+    """
+    stmt = (select(Account.pub_id, Account.name, Account.is_merchant,
+                   AccountUser.pub_id.label('user_id'), AccountUser.name.label('user_name'), AccountUser.mask)
+            .outerjoin(AccountUser)
+            .where(Account.owner_id == auth_user.id)
+            .order_by(Account.name, AccountUser.order))
+
+    if not include_merchants:
+        stmt = stmt.where(Account.is_merchant == False)
+
+    accounts = []
+    for (pub_id, name, is_merchant), rows in groupby((await db.exec(stmt)).all(), key=itemgetter(0, 1, 2)):
+        accounts.append({
+            'name': name,
+            'isMerchant': is_merchant,
+            'users': [{'name': r.user_name, 'mask': r.mask, 'id': r.user_id} for r in rows if r.user_id],
+            'id': pub_id,
+        })
+
+    return accounts
+
+
+async def get_account_users_pub_id_to_id_map(db: AsyncSession, auth_user: AuthUser, ids: list[str]) -> dict[str, str]:
     statement = (select(AccountUser.id, AccountUser.pub_id)
                  .join(Account)
                  .where(Account.owner_id == auth_user.id)
                  .where(AccountUser.pub_id.in_(ids)))
 
-    results = db.exec(statement).all()
+    results = (await db.exec(statement)).all()
 
     id_map = {pub_id: id for id, pub_id in results}
     for x in ids:
@@ -49,6 +85,7 @@ def get_account_users_pub_id_to_id_map(db: Session, auth_user: AuthUser, ids: li
 
 def get_account_by_id_stmt(auth_user: AuthUser, id: str, include_merchants: bool = False) -> SelectBase[Account]:
     stmt = (select(Account)
+            .options(selectinload(Account.users))
             .where(Account.owner_id == auth_user.id)
             .where(Account.pub_id == id))
 
@@ -58,30 +95,33 @@ def get_account_by_id_stmt(auth_user: AuthUser, id: str, include_merchants: bool
     return stmt
 
 
-def get_raw_account_by_id(db: Session, auth_user: AuthUser, id: str, include_merchants: bool = False) -> Account:
-    return db.exec(get_account_by_id_stmt(auth_user, id, include_merchants)).one()
+async def get_raw_account_by_id(db: AsyncSession, auth_user: AuthUser, id: str,
+                                include_merchants: bool = False) -> Account:
+    return (await db.exec(get_account_by_id_stmt(auth_user, id, include_merchants))).one()
 
 
-def get_raw_account_or_none_by_id(db: Session, auth_user: AuthUser, id: str,
-                                  include_merchants: bool = False) -> Account | None:
-    return db.exec(get_account_by_id_stmt(auth_user, id, include_merchants)).one_or_none()
+async def get_raw_account_or_none_by_id(db: AsyncSession, auth_user: AuthUser, id: str,
+                                        include_merchants: bool = False) -> Account | None:
+    return (await db.exec(get_account_by_id_stmt(auth_user, id, include_merchants))).one_or_none()
 
 
-def get_account_by_id(db: Session, auth_user: AuthUser, id: str, include_merchants: bool = False) -> AccountRead:
-    return map_account(get_raw_account_by_id(db, auth_user, id, include_merchants))
+async def get_account_by_id(db: AsyncSession, auth_user: AuthUser, id: str,
+                            include_merchants: bool = False) -> AccountRead:
+    return map_account(await get_raw_account_by_id(db, auth_user, id, include_merchants))
 
 
-def create_account(db: Session, auth_user: AuthUser, account: AccountCreate, id: str = None) -> AccountRead:
+async def create_account(db: AsyncSession, auth_user: AuthUser, account: AccountCreate, id: str = None) -> AccountRead:
     users = [AccountUser(name=u.name, mask=u.mask, order=i) for i, u in enumerate(account.users)]
     account = Account(pub_id=id, name=account.name, is_merchant=account.is_merchant, users=users, owner_id=auth_user.id)
 
     db.add(account)
-    db.commit()
+    await bump_data_version(db, auth_user.id)
+    await db.commit()
 
     return map_account(account)
 
 
-def update_account(db: Session, account: Account, account_in: AccountUpdate) -> AccountRead:
+async def update_account(db: AsyncSession, account: Account, account_in: AccountUpdate) -> AccountRead:
     account.name = account_in.name
     account.is_merchant = account_in.is_merchant
 
@@ -103,25 +143,152 @@ def update_account(db: Session, account: Account, account_in: AccountUpdate) ->
                 order=i
             ))
 
+    deleted_user_ids = []
     for uid, old_user in old_users.items():
         # iterate through old account users to delete
         if uid not in new_users_by_id:
-            db.delete(old_user)
+            await db.delete(old_user)
+            deleted_user_ids.append(old_user.id)
 
     db.add(account)
-    db.commit()
-    db.refresh(account)
+    await delete_account_users_rollup(db, deleted_user_ids)
+    await bump_data_version(db, account.owner_id)
+    await db.commit()
+    await db.refresh(account, ['users'])
 
     return map_account(account)
 
 
-def upsert_account(db: Session, auth_user: AuthUser, id: str, account: AccountUpdate) -> (AccountRead, bool):
-    account_raw = get_raw_account_or_none_by_id(db, auth_user, id, include_merchants=True)
-    return (create_account(db, auth_user, account, id=id), True) if not account_raw else (
-        update_account(db, account_raw, account), False)
-
-
-def delete_account(db: Session, auth_user: AuthUser, id: str):
-    account_raw = get_raw_account_by_id(db, auth_user, id, include_merchants=True)
-    db.delete(account_raw)
-    db.commit()
+async def upsert_account(db: AsyncSession, auth_user: AuthUser, id: str, account: AccountUpdate) -> (AccountRead, bool):
+    account_raw = await get_raw_account_or_none_by_id(db, auth_user, id, include_merchants=True)
+    return (await create_account(db, auth_user, account, id=id), True) if not account_raw else (
+        await update_account(db, account_raw, account), False)
+
+
+async def upsert_accounts(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        accounts: list[AccountBulkUpdate]
+) -> list[AccountBulkResult]:
+    """
+    Same as `upsert_account` for many accounts at once, in one DB transaction and a fixed number of
+    statements. Items that would break `uniq_owner_name` or `uniq_account_mask`, or take the id of an
+    account or account user they do not own, are reported as conflicts and left out of the batch.
+    """
+    results = [AccountBulkResult(index=i) for i in range(len(accounts))]
+    ids = [a.id for a in accounts]
+    user_ids = [u.id for a in accounts for u in a.users if u.id]
+
+    stmt = (select(Account.id, Account.pub_id, Account.name, Account.owner_id)
+            .where(or_(Account.pub_id.in_(ids),
+                       and_(Account.owner_id == auth_user.id, Account.name.in_([a.name for a in accounts])))))
+    rows = (await db.exec(stmt)).all()
+    owned = {pub_id: (id, name) for id, pub_id, name, owner_id in rows if owner_id == auth_user.id}
+    foreign = {pub_id for _, pub_id, _, owner_id in rows if owner_id != auth_user.id}
+
+    stmt = (select(AccountUser.id, AccountUser.pub_id, AccountUser.account_id)
+            .where(or_(AccountUser.account_id.in_([id for id, _ in owned.values()]),
+                       AccountUser.pub_id.in_(user_ids))))
+    users = (await db.exec(stmt)).all()
+    user_ids_by_pub_id = {pub_id: (id, account_id) for id, pub_id, account_id in users}
+
+    seen_ids, seen_user_ids = set(), set()
+    for result, a in zip(results, accounts):
+        account_id = owned[a.id][0] if a.id in owned else None
+        a_user_ids = [u.id for u in a.users if u.id]
+        if a.id in seen_ids or a.id in foreign:
+            result.error = 'Account id is taken'
+        elif len(set(u.mask for u in a.users)) != len(a.users):
+            result.error = 'Account has duplicate user masks'
+        elif any(uid in seen_user_ids or uid in user_ids_by_pub_id and user_ids_by_pub_id[uid][1] != account_id
+                 for uid in a_user_ids) or len(set(a_user_ids)) != len(a_user_ids):
+            result.error = 'Account user id is taken'
+        seen_ids.add(a.id)
+        seen_user_ids.update(a_user_ids)
+
+    # a rejected account keeps its old name, which can in turn reject an item that claimed it, so
+    # names are assigned in order until no new conflicts come up
+    valid = [i for i, r in enumerate(results) if not r.error]
+    while True:
+        pending = {accounts[i].id for i in valid}
+        claimed = {name for pub_id, (_, name) in owned.items() if pub_id not in pending}
+        conflicts = set()
+        for i in valid:
+            if accounts[i].name in claimed:
+                conflicts.add(i)
+            claimed.add(accounts[i].name)
+        if not conflicts:
+            break
+        for i in conflicts:
+            results[i].error = 'Account name is taken'
+        valid = [i for i in valid if i not in conflicts]
+
+    valid = [(results[i], accounts[i]) for i in valid]
+    if not valid:
+        return results
+
+    # rows are written in whatever order, so uniqueness is only checked against the final state
+    await db.exec(text('SET CONSTRAINTS core.uniq_owner_name, core.uniq_account_mask DEFERRED'))
+
+    new = [a for _, a in valid if a.id not in owned]
+    updated = [a for _, a in valid if a.id in owned]
+    account_ids = {a.id: owned[a.id][0] for a in updated}
+
+    if new:
+        new_ids = (await db.exec(
+            insert(Account).returning(Account.id, sort_by_parameter_order=True),
+            params=[{'pub_id': a.id, 'name': a.name, 'is_merchant': a.is_merchant, 'owner_id': auth_user.id}
+                    for a in new]
+        )).scalars().all()
+        account_ids.update(zip([a.id for a in new], new_ids))
+
+    if updated:
+        await db.exec(update(Account), params=[{
+            'id': account_ids[a.id],
+            'name': a.name,
+            'is_merchant': a.is_merchant,
+        } for a in updated])
+
+    new_users, updated_users, kept_user_ids = [], [], set()
+    for result, a in valid:
+        account_users = []
+        for i, u in enumerate(a.users):
+            if u.id in user_ids_by_pub_id:
+                id = user_ids_by_pub_id[u.id][0]
+                updated_users.append({'id': id, 'name': u.name, 'mask': u.mask, 'order': i})
+                kept_user_ids.add(id)
+                account_users.append(AccountUserRead(id=u.id, name=u.name, mask=u.mask))
+            else:
+                pub_id = u.id or generate()
+                new_users.append({'pub_id': pub_id, 'name': u.name, 'mask': u.mask, 'order': i,
+                                  'account_id': account_ids[a.id]})
+                account_users.append(AccountUserRead(id=pub_id, name=u.name, mask=u.mask))
+
+        result.created = a.id not in owned
+        result.account = AccountRead(id=a.id, name=a.name, is_merchant=a.is_merchant, users=account_users)
+
+    updated_account_ids = {account_ids[a.id] for a in updated}
+    deleted_user_ids = [id for id, _, account_id in users
+                        if account_id in updated_account_ids and id not in kept_user_ids]
+    if deleted_user_ids:
+        await delete_account_users_rollup(db, deleted_user_ids)
+        await db.exec(delete(AccountUser).where(AccountUser.id.in_(deleted_user_ids)))
+
+    if updated_users:
+        await db.exec(update(AccountUser), params=updated_users)
+
+    if new_users:
+        await db.exec(insert(AccountUser), params=new_users)
+
+    await bump_data_version(db, auth_user.id)
+    await db.commit()
+
+    return results
+
+
+async def delete_account(db: AsyncSession, auth_user: AuthUser, id: str):
+    account_raw = await get_raw_account_by_id(db, auth_user, id, include_merchants=True)
+    await delete_account_users_rollup(db, [u.id for u in account_raw.users])
+    await db.delete(account_raw)
+    await bump_data_version(db, auth_user.id)
+    await db.commit()
@@ -36,6 +36,18 @@ class TestGetAll:
         assert_account(data[0], account)
 
 
+    def test_get_all_same_as_get(self, client: TestClient, auth_user: AuthUser, account: dict):
+        account['users'].append({'name': 'Jane Doe', 'mask': '1111'})
+        client.put('/accounts/b', json=account)
+        client.put('/accounts/a', json={**account, 'name': 'Another', 'users': []})
+
+        # listings are built without the ORM, but read the same as single accounts
+        response = client.get('/accounts')
+        assert [a['id'] for a in response.json()] == ['a', 'b']
+        for a in response.json():
+            assert client.get(f'/accounts/{a['id']}').json() == a
+
+
 class TestGet:
     def test_get_nonexistent(self, client: TestClient, auth_user: AuthUser):
         response = client.get('/accounts/nonexistent')
@@ -151,6 +163,83 @@ class TestUpdate:
         assert_account(data2, data)
 
 
+class TestUpsertBulk:
+    def test_upsert_bulk(self, client: TestClient, auth_user: AuthUser, account: dict):
+        existing = client.put('/accounts/a', json=account).json()
+        existing['name'] = 'Renamed'
+        existing['users'].append({'name': 'Jane Doe', 'mask': '1111'})
+        merchant = {'id': 'm', 'name': 'Merchant', 'isMerchant': True, 'users': [{'name': 'Merchant', 'mask': '9'}]}
+
+        response = client.put('/accounts/bulk', json=[existing, {**account, 'id': 'b'}, merchant])
+        data = response.json()
+
+        assert response.status_code == HTTP_200_OK
+        assert [(r['index'], r['created'], r['error']) for r in data] == [(0, False, None), (1, True, None),
+                                                                         (2, True, None)]
+        assert data[0]['account'] == client.get('/accounts/a').json()
+        assert data[1]['account'] == client.get('/accounts/b').json()
+        assert data[2]['account'] == client.get('/accounts/m?include_merchants=true').json()
+        assert data[0]['account']['users'][0]['id'] == existing['users'][0]['id']
+        assert_account(data[0]['account'], existing)
+
+    def test_upsert_bulk_delete_user(self, client: TestClient, auth_user: AuthUser, account: dict):
+        account['users'].append({'name': 'Jane Doe', 'mask': '1111'})
+        data = client.put('/accounts/a', json=account).json()
+
+        # the new user takes the mask of the removed one
+        data['users'] = [data['users'][1], {'name': 'Jim Doe', 'mask': '0000'}]
+        response = client.put('/accounts/bulk', json=[data])
+
+        assert response.json()[0]['error'] is None
+        assert_account(client.get('/accounts/a').json(), data)
+
+    def test_upsert_bulk_conflicts(self, client: TestClient, auth_user: AuthUser, account: dict):
+        client.put('/accounts/a', json=account)
+        other = client.put('/accounts/other', json={**account, 'name': 'Other'}).json()
+
+        response = client.put('/accounts/bulk', json=[
+            {**account, 'id': 'b'},
+            {**account, 'id': 'c', 'name': 'New'},
+            {**account, 'id': 'd', 'name': 'New'},
+            {**account, 'id': 'e', 'name': 'Masks', 'users': account['users'] * 2},
+            {**account, 'id': 'f', 'name': 'Users', 'users': other['users']},
+            {**account, 'id': 'c', 'name': 'Again'},
+        ])
+        data = response.json()
+
+        assert response.status_code == HTTP_200_OK
+        assert [r['error'] is None for r in data] == [False, True, False, False, False, False]
+        assert all(r['account'] is None for r in data if r['error'])
+        assert [a['id'] for a in client.get('/accounts').json()] == ['a', 'c', 'other']
+
+    def test_upsert_bulk_rename_chain(self, client: TestClient, auth_user: AuthUser, account: dict):
+        client.put('/accounts/a', json={**account, 'name': 'A'})
+        client.put('/accounts/b', json={**account, 'name': 'B'})
+
+        # b cannot take the name of c, so it keeps B and a cannot be renamed to it either
+        response = client.put('/accounts/bulk', json=[
+            {**account, 'id': 'a', 'name': 'B'},
+            {**account, 'id': 'c', 'name': 'C'},
+            {**account, 'id': 'b', 'name': 'C'},
+        ])
+
+        assert [r['error'] is None for r in response.json()] == [False, True, False]
+        assert [a['name'] for a in client.get('/accounts').json()] == ['A', 'B', 'C']
+
+
+    def test_upsert_bulk_swap_names(self, client: TestClient, auth_user: AuthUser, account: dict):
+        client.put('/accounts/a', json={**account, 'name': 'A'})
+        client.put('/accounts/b', json={**account, 'name': 'B'})
+
+        response = client.put('/accounts/bulk', json=[
+            {**account, 'id': 'a', 'name': 'B'},
+            {**account, 'id': 'b', 'name': 'A'},
+        ])
+
+        assert [r['error'] for r in response.json()] == [None, None]
+        assert [a['id'] for a in client.get('/accounts').json()] == ['b', 'a']
+
+
 class TestDelete:
     def test_delete_nonexistent(self, client: TestClient, auth_user: AuthUser, account: dict):
         response = client.delete('/accounts/nonexistent')
@@ -1,5 +1,6 @@
 from datetime import datetime
 
+from sqlalchemy import DDL, event
 from sqlmodel import Field, Relationship
 
 from app.base.models import AuthBase
@@ -41,13 +42,32 @@ class AuthSession(AuthBase, table=True):
     __tablename__ = 'session'
 
     id: str = Field(primary_key=True)
-    session_token: str
+    # looked up on every request that is not served from the auth cache
+    session_token: str = Field(index=True)
     expires: datetime
 
     user_id: str = Field(foreign_key='authjs.user.id', ondelete='RESTRICT')
     user: AuthUser = Relationship(back_populates='sessions')
 
 
+# Notified with the token of every session signed out or changed, so workers stop serving it from cache
+SESSION_CHANGE_CHANNEL = 'adfire_session_changed'
+
+# Auth.js writes sessions itself, so the notification comes from a trigger rather than from a service
+event.listen(AuthSession.__table__, 'after_create', DDL(f"""
+    CREATE OR REPLACE FUNCTION authjs.notify_session_change() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{SESSION_CHANGE_CHANNEL}', OLD.session_token);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""))
+event.listen(AuthSession.__table__, 'after_create', DDL("""
+    CREATE TRIGGER notify_session_change AFTER UPDATE OR DELETE ON authjs.session
+    FOR EACH ROW EXECUTE FUNCTION authjs.notify_session_change()
+"""))
+
+
 class AuthVerificationToken(AuthBase, table=True):
     __tablename__ = 'verification_token'
 
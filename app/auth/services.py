@@ -0,0 +1,148 @@
+import hmac
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import lru_cache
+from hashlib import sha512
+from os import urandom
+from time import time
+from typing import Any
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import Cipher
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.ciphers.algorithms import AES
+from cryptography.hazmat.primitives.ciphers.modes import CBC
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.padding import PKCS7
+
+from app.auth.models import AuthUser, AuthSession
+from app.base.cache import TTLCache
+from app.config import get_settings
+
+SESSION_COOKIE = 'authjs.session-token'
+
+# Leeway Auth.js itself allows when checking `exp`
+CLOCK_TOLERANCE = 15
+
+
+class InvalidSessionToken(ValueError):
+    pass
+
+
+@lru_cache
+def get_auth_cache() -> TTLCache[str, AuthUser]:
+    """Returns this worker's cache of resolved users keyed by session token."""
+    settings = get_settings()
+    return TTLCache(settings.auth_cache_size, settings.auth_cache_ttl)
+
+
+def cache_auth_session(auth_session: AuthSession, user: AuthUser):
+    get_auth_cache().set(auth_session.session_token, user, expires_at=auth_session.expires.timestamp())
+
+
+def invalidate_session_token(session_token: str):
+    """Forgets `session_token`, as the session is signed out or changed in any worker."""
+    get_auth_cache().pop(session_token)
+
+
+# <*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*> JWT Sessions <*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*>
+
+def _b64decode(s: str) -> bytes:
+    return urlsafe_b64decode(s + '=' * (-len(s) % 4))
+
+
+def _b64encode(b: bytes) -> str:
+    return urlsafe_b64encode(b).rstrip(b'=').decode()
+
+
+@lru_cache
+def derive_encryption_key(secret: str, salt: str, enc: str) -> bytes:
+    """Derives the JWE content key the same way Auth.js does from `AUTH_SECRET`."""
+    return HKDF(
+        algorithm=SHA256(),
+        length=64 if enc == 'A256CBC-HS512' else 32,
+        salt=salt.encode(),
+        info=f'Auth.js Generated Encryption Key ({salt})'.encode(),
+    ).derive(secret.encode())
+
+
+def _cbc_hs512_tag(mac_key: bytes, aad: bytes, iv: bytes, ciphertext: bytes) -> bytes:
+    al = (len(aad) * 8).to_bytes(8, 'big')
+    return hmac.new(mac_key, aad + iv + ciphertext + al, sha512).digest()[:32]
+
+
+def is_session_jwe(token: str) -> bool:
+    """Whether `token` looks like a compact JWE rather than a database session token."""
+    return token.count('.') == 4
+
+
+def encode_session_token(
+        claims: dict[str, Any],
+        secret: str,
+        salt: str = SESSION_COOKIE,
+        enc: str = 'A256CBC-HS512',
+) -> str:
+    protected = _b64encode(json.dumps({'alg': 'dir', 'enc': enc}).encode())
+    key = derive_encryption_key(secret, salt, enc)
+    plaintext = json.dumps(claims).encode()
+
+    if enc == 'A256GCM':
+        iv = urandom(12)
+        sealed = AESGCM(key).encrypt(iv, plaintext, protected.encode())
+        ciphertext, tag = sealed[:-16], sealed[-16:]
+    else:
+        iv = urandom(16)
+        padder = PKCS7(128).padder()
+        encryptor = Cipher(AES(key[32:]), CBC(iv)).encryptor()
+        ciphertext = encryptor.update(padder.update(plaintext) + padder.finalize()) + encryptor.finalize()
+        tag = _cbc_hs512_tag(key[:32], protected.encode(), iv, ciphertext)
+
+    return '.'.join((protected, '', _b64encode(iv), _b64encode(ciphertext), _b64encode(tag)))
+
+
+def decode_session_token(token: str, secret: str, salt: str = SESSION_COOKIE) -> dict[str, Any]:
+    """Decrypts an Auth.js JWT session cookie and returns its claims if it has not expired."""
+    try:
+        protected, encrypted_key, iv, ciphertext, tag = token.split('.')
+        header = json.loads(_b64decode(protected))
+        iv, ciphertext, tag = _b64decode(iv), _b64decode(ciphertext), _b64decode(tag)
+    except ValueError as e:
+        raise InvalidSessionToken('Malformed session token') from e
+
+    enc = header.get('enc')
+    if header.get('alg') != 'dir' or encrypted_key or enc not in ('A256CBC-HS512', 'A256GCM'):
+        raise InvalidSessionToken('Unsupported session token encryption')
+
+    key = derive_encryption_key(secret, salt, enc)
+    try:
+        if enc == 'A256GCM':
+            plaintext = AESGCM(key).decrypt(iv, ciphertext + tag, protected.encode())
+        else:
+            if not hmac.compare_digest(tag, _cbc_hs512_tag(key[:32], protected.encode(), iv, ciphertext)):
+                raise InvalidTag()
+            decryptor = Cipher(AES(key[32:]), CBC(iv)).decryptor()
+            unpadder = PKCS7(128).unpadder()
+            plaintext = unpadder.update(decryptor.update(ciphertext) + decryptor.finalize()) + unpadder.finalize()
+        claims = json.loads(plaintext)
+    except (InvalidTag, ValueError) as e:
+        raise InvalidSessionToken('Session token failed verification') from e
+
+    if claims.get('exp', 0) + CLOCK_TOLERANCE <= time():
+        raise InvalidSessionToken('Session token expired')
+
+    return claims
+
+
+def get_jwt_auth_user(token: str) -> AuthUser:
+    """Builds the user from the claims of a JWT session cookie without touching the database."""
+    claims = decode_session_token(token, get_settings().auth_secret)
+    if not claims.get('sub'):
+        raise InvalidSessionToken('Session token has no subject')
+
+    return AuthUser(
+        id=claims['sub'],
+        name=claims.get('name'),
+        email=claims.get('email'),
+        image=claims.get('picture'),
+    )
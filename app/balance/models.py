@@ -1,6 +1,28 @@
-from app.base.models import RouteBase, TimeSeries
+import datetime
 
+from sqlalchemy import BigInteger
+from sqlmodel import Field
+
+from app.base.models import CoreBase, RouteBase, TimeSeries, Money
+
+
+class DailyBalance(CoreBase, table=True):
+    """Net amount of the entries of an account user on one day, kept in sync by the transaction services."""
+    __tablename__ = 'daily_balance'
+
+    account_user_id: int = Field(foreign_key='core.account_user.id', ondelete='CASCADE', primary_key=True)
+    date: datetime.date = Field(primary_key=True)
+    # in cents
+    amount: int = Field(sa_type=BigInteger)
+    entry_count: int
+
+
+# <*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*> Route Models <*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*>
 
 class Balance(RouteBase):
     balances: list[TimeSeries]
 
+
+class BalanceAsOf(RouteBase):
+    as_of: datetime.date
+    balance: Money
@@ -0,0 +1,161 @@
+"""
+Maintenance of the `core.daily_balance` rollup, which balance reads scan instead of every entry.
+
+Run `python -m app.balance.rollup rebuild` to backfill it from `core.transaction_entry`, and
+`python -m app.balance.rollup verify` to check that it still matches.
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import date
+from typing import Iterable
+
+from sqlalchemy import delete, func, select, literal_column, and_, or_, tuple_, cast, BigInteger
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.accounts.models import Account, AccountUser
+from app.balance.models import DailyBalance
+from app.config import get_settings
+from app.db import create_db_engine, create_db_session
+from app.transactions.models import TransactionEntry
+
+RollupKey = tuple[int, date]
+
+
+class RollupDeltas:
+    """Net change to the rollup rows touched by a write, accumulated before it is applied."""
+
+    def __init__(self):
+        self.amounts: dict[RollupKey, int] = defaultdict(int)
+        self.entry_counts: dict[RollupKey, int] = defaultdict(int)
+
+    def add(self, account_user_id: int | None, date: date, amount: int, sign: int = 1):
+        if account_user_id is None:
+            return
+        self.amounts[(account_user_id, date)] += sign * amount
+        self.entry_counts[(account_user_id, date)] += sign
+
+    def add_entries(self, entries: Iterable[TransactionEntry], sign: int = 1):
+        for e in entries:
+            self.add(e.account_user_id, e.date, e.amount, sign)
+
+    def remove_entries(self, entries: Iterable[TransactionEntry]):
+        self.add_entries(entries, sign=-1)
+
+
+async def apply_rollup_deltas(db: AsyncSession, deltas: RollupDeltas):
+    """Applies `deltas` in the current transaction of `db`; the caller commits."""
+    keys = [k for k in deltas.amounts if deltas.amounts[k] or deltas.entry_counts[k]]
+    if not keys:
+        return
+
+    stmt = insert(DailyBalance).values([{
+        'account_user_id': account_user_id,
+        'date': d,
+        'amount': deltas.amounts[(account_user_id, d)],
+        'entry_count': deltas.entry_counts[(account_user_id, d)],
+    } for account_user_id, d in keys])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyBalance.account_user_id, DailyBalance.date],
+        set_={
+            'amount': DailyBalance.amount + stmt.excluded.amount,
+            'entry_count': DailyBalance.entry_count + stmt.excluded.entry_count,
+        }
+    )
+    await db.exec(stmt)
+
+    # days left without entries disappear, like they would from a scan over entries
+    await db.exec(delete(DailyBalance).where(
+        DailyBalance.entry_count <= 0,
+        tuple_(DailyBalance.account_user_id, DailyBalance.date).in_(keys)
+    ))
+
+
+async def delete_account_users_rollup(db: AsyncSession, account_user_ids: list[int]):
+    if account_user_ids:
+        await db.exec(delete(DailyBalance).where(DailyBalance.account_user_id.in_(account_user_ids)))
+
+
+def entries_rollup_stmt(owner_id: str | None = None):
+    """Aggregates `core.transaction_entry` into rollup rows, optionally for one owner."""
+    stmt = (select(TransactionEntry.account_user_id,
+                   TransactionEntry.date,
+                   cast(func.sum(TransactionEntry.amount), BigInteger).label('amount'),
+                   func.count().label('entry_count'))
+            .join(AccountUser)
+            .group_by(TransactionEntry.account_user_id, TransactionEntry.date))
+
+    if owner_id:
+        stmt = stmt.join(Account).where(Account.owner_id == owner_id)
+
+    return stmt
+
+
+def owned_account_users(owner_id: str):
+    return select(AccountUser.id).join(Account).where(Account.owner_id == owner_id)
+
+
+async def rebuild_rollup(db: AsyncSession, owner_id: str | None = None) -> int:
+    """Recomputes the rollup from entries, for every user or only `owner_id`, and returns its row count."""
+    stmt = delete(DailyBalance)
+    if owner_id:
+        stmt = stmt.where(DailyBalance.account_user_id.in_(owned_account_users(owner_id)))
+    await db.exec(stmt)
+
+    rollup = entries_rollup_stmt(owner_id)
+    result = await db.exec(insert(DailyBalance).from_select(
+        ['account_user_id', 'date', 'amount', 'entry_count'], rollup
+    ))
+    await db.commit()
+
+    return result.rowcount
+
+
+async def verify_rollup(db: AsyncSession, owner_id: str | None = None) -> list[tuple]:
+    """
+    Returns `(account_user_id, date, rollup amount, entries amount)` for every day where the
+    rollup disagrees with the entries it summarizes.
+    """
+    expected = entries_rollup_stmt(owner_id).subquery()
+    actual = select(DailyBalance)
+    if owner_id:
+        actual = actual.where(DailyBalance.account_user_id.in_(owned_account_users(owner_id)))
+    actual = actual.subquery()
+
+    stmt = (select(func.coalesce(actual.c.account_user_id, expected.c.account_user_id),
+                   func.coalesce(actual.c.date, expected.c.date),
+                   actual.c.amount,
+                   expected.c.amount)
+            .select_from(actual.join(expected, and_(actual.c.account_user_id == expected.c.account_user_id,
+                                                    actual.c.date == expected.c.date), full=True))
+            .where(or_(actual.c.entry_count.is_distinct_from(expected.c.entry_count),
+                       actual.c.amount.is_distinct_from(expected.c.amount)))
+            .order_by(literal_column('1'), literal_column('2')))
+
+    return list((await db.exec(stmt)).all())
+
+
+async def main(command: str, owner_id: str | None):
+    engine = create_db_engine(get_settings())
+    try:
+        async with create_db_session(engine) as db:
+            if command == 'rebuild':
+                print(f'Rebuilt {await rebuild_rollup(db, owner_id)} daily balance rows')
+                return 0
+
+            mismatches = await verify_rollup(db, owner_id)
+            for account_user_id, d, actual, expected in mismatches:
+                print(f'account_user_id={account_user_id} date={d} rollup={actual} entries={expected}')
+            print(f'{len(mismatches)} mismatched daily balance rows')
+            return 1 if mismatches else 0
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['rebuild', 'verify'])
+    parser.add_argument('--owner-id', help='Only process accounts owned by this user')
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args.command, args.owner_id)))
@@ -1,15 +1,41 @@
-from fastapi import APIRouter
+from datetime import date
 
-from app.balance.models import Balance
-from app.balance.services import get_balances
-from app.deps import DBSessionDep, AuthUserDep
+from fastapi import APIRouter, Depends
+from fastapi.params import Query
+
+from app.balance.models import Balance, BalanceAsOf
+from app.balance.services import get_balances, get_balance_as_of_date, get_cached_balance
+from app.base.models import Granularity
+from app.deps import check_data_version, DBSessionDep, AuthUserDep, DataVersionDep
+from app.timing import TimedRoute
 
 router = APIRouter(
     prefix='/balance',
-    tags=['balance']
+    tags=['balance'],
+    dependencies=[Depends(check_data_version)],
+    route_class=TimedRoute,
 )
 
 
 @router.get('/')
-async def get(db: DBSessionDep, auth_user: AuthUserDep) -> Balance:
-    return get_balances(db, auth_user)
+async def get(
+        db: DBSessionDep,
+        auth_user: AuthUserDep,
+        version: DataVersionDep,
+        start: date | None = Query(None, alias='from'),
+        end: date | None = Query(None, alias='to'),
+        granularity: Granularity = 'day',
+        as_of: date | None = Query(None, alias='asOf'),
+) -> Balance | BalanceAsOf:
+    """
+    Returns the balance series of all accounts from `auth_user` between `from` and `to`, with one
+    point per `granularity` bucket. Cumulative values include activity before `from`.
+
+    With `asOf`, returns only the balance at the end of that day instead.
+    """
+    if as_of:
+        return await get_cached_balance(auth_user, version, ('as_of', as_of),
+                                        lambda: get_balance_as_of_date(db, auth_user, as_of))
+
+    return await get_cached_balance(auth_user, version, ('series', start, end, granularity),
+                                    lambda: get_balances(db, auth_user, start, end, granularity))
@@ -1,25 +1,70 @@
-from operator import attrgetter
+from datetime import date
+from functools import lru_cache
+from typing import Awaitable, Callable, Hashable, TypeVar
 
-from sqlalchemy.orm import selectinload
-from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.accounts.models import Account, AccountUser
+from app.accounts.models import Account
 from app.auth.models import AuthUser
-from app.balance.models import Balance
-from app.transactions.services import aggregate_entries
-
-
-def get_balances(db: Session, auth_user: AuthUser, ) -> Balance:
-    stmt = (
-        select(Account)
-        .where(Account.owner_id == auth_user.id)
-        .where(Account.is_merchant == False)
-        .options(
-            selectinload(Account.users)
-            .selectinload(AccountUser.entries)
-        )
+from app.balance.models import Balance, BalanceAsOf
+from app.base.cache import TTLCache
+from app.base.models import Granularity, Cents
+from app.config import get_settings
+from app.transactions.services import get_balance_series, get_balance_as_of
+
+T = TypeVar('T')
+
+
+@lru_cache
+def get_balance_cache() -> TTLCache[tuple, object]:
+    """Returns this worker's cache of computed balances keyed by user, data version and parameters."""
+    settings = get_settings()
+    return TTLCache(settings.balance_cache_size, settings.balance_cache_ttl)
+
+
+async def get_cached_balance(auth_user: AuthUser, version: int, key: Hashable, compute: Callable[[], Awaitable[T]]) -> T:
+    """
+    Returns the balance of `auth_user` identified by `key`, computing it on a miss. Results are kept
+    per data `version`, so one computed while a write commits is never served after it.
+    """
+    key = (auth_user.id, version, key)
+    value = get_balance_cache().get(key)
+    if value is None:
+        value = await compute()
+        get_balance_cache().set(key, value)
+    return value
+
+
+def invalidate_balance_cache(user_id: str):
+    """Forgets every cached balance of user `user_id`."""
+    get_balance_cache().evict(lambda key, value: key[0] == user_id)
+
+
+async def get_balances(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        start: date | None = None,
+        end: date | None = None,
+        granularity: Granularity = 'day',
+) -> Balance:
+    balances = await get_balance_series(
+        db,
+        Account.owner_id == auth_user.id,
+        Account.is_merchant == False,
+        start=start,
+        end=end,
+        granularity=granularity,
     )
 
-    accounts = db.exec(stmt).all()
+    return Balance(balances=balances)
+
+
+async def get_balance_as_of_date(db: AsyncSession, auth_user: AuthUser, as_of: date) -> BalanceAsOf:
+    balance = await get_balance_as_of(
+        db,
+        Account.owner_id == auth_user.id,
+        Account.is_merchant == False,
+        as_of=as_of,
+    )
 
-    return Balance(balances=aggregate_entries(e for a in accounts for u in a.users for e in u.entries))
+    return BalanceAsOf(as_of=as_of, balance=Cents(balance))
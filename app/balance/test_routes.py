@@ -0,0 +1,248 @@
+import asyncio
+from time import sleep, time
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session, delete
+from starlette.status import HTTP_200_OK
+from starlette.testclient import TestClient
+
+from app import caches
+from app.auth.models import AuthUser, SESSION_CHANGE_CHANNEL
+from app.balance.models import DailyBalance
+from app.balance.rollup import main as rollup_main
+from app.base.versions import DATA_CHANGE_CHANNEL
+from app.db import QueryCounter
+from app.transactions.models import TransactionEntry
+
+
+@pytest.fixture
+def init_transactions(client: TestClient, auth_user: AuthUser, account: dict):
+    user_id = client.put('/accounts/checking', json=account).json()['users'][0]['id']
+    merchant = {'name': 'Groceries Inc', 'isMerchant': True, 'users': [{'name': 'Groceries Inc', 'mask': '9999'}]}
+    merchant_id = client.put('/accounts/merchant', json=merchant).json()['users'][0]['id']
+
+    for name, day, amount, debit_id, credit_id in (
+            ('Groceries', '2025-05-01', 100, user_id, merchant_id),
+            ('Snacks', '2025-05-01', 20, user_id, merchant_id),
+            ('Refund', '2025-05-03', 50, merchant_id, user_id),
+    ):
+        client.post('/transactions', json={
+            'name': name,
+            'debits': [{'amount': amount, 'date': day, 'accountUserId': debit_id}],
+            'credits': [{'amount': amount, 'date': day, 'accountUserId': credit_id}],
+        })
+    yield
+
+
+class TestGet:
+    def test_get_empty(self, client: TestClient, auth_user: AuthUser):
+        response = client.get('/balance')
+        assert response.status_code == HTTP_200_OK
+        assert response.json() == {'balances': []}
+
+    def test_get_excludes_merchants(self, client: TestClient, auth_user: AuthUser, init_transactions):
+        response = client.get('/balance')
+        assert response.status_code == HTTP_200_OK
+        assert response.json()['balances'] == [
+            {'date': '2025-05-01', 'amount': -120, 'cumulative': -120},
+            {'date': '2025-05-03', 'amount': 50, 'cumulative': -70},
+        ]
+
+    def test_get_account(self, client: TestClient, auth_user: AuthUser, init_transactions):
+        response = client.get('/accounts/checking/balance')
+        data = response.json()
+        assert response.status_code == HTTP_200_OK
+        assert data['balances'] == data['users'][0]['balances'] == [
+            {'date': '2025-05-01', 'amount': -120, 'cumulative': -120},
+            {'date': '2025-05-03', 'amount': 50, 'cumulative': -70},
+        ]
+
+    def test_get_after_update_and_delete(self, client: TestClient, auth_user: AuthUser, init_transactions):
+        transactions = client.get('/transactions').json()
+        refund = next(t for t in transactions if t['name'] == 'Refund')
+        snacks = next(t for t in transactions if t['name'] == 'Snacks')
+
+        refund['debits'][0]['amount'] = refund['credits'][0]['amount'] = 80
+        refund['credits'][0]['date'] = '2025-05-04'
+        client.put(f'/transactions/{refund['id']}', json={k: refund[k] for k in ('name', 'debits', 'credits')})
+        client.delete(f'/transactions/{snacks['id']}')
+
+        response = client.get('/balance')
+        assert response.json()['balances'] == [
+            {'date': '2025-05-01', 'amount': -100, 'cumulative': -100},
+            {'date': '2025-05-04', 'amount': 80, 'cumulative': -20},
+        ]
+
+    def test_get_after_account_user_removed(self, client: TestClient, auth_user: AuthUser, account: dict,
+                                            init_transactions):
+        account['users'] = [{'name': 'Jane Doe', 'mask': '1111'}]
+        client.put('/accounts/checking', json=account)
+
+        response = client.get('/balance')
+        assert response.json()['balances'] == []
+
+    @pytest.mark.parametrize('params,expected', [
+        ({'from': '2025-05-02'}, [('2025-05-03', 50, -70)]),
+        ({'to': '2025-05-02'}, [('2025-05-01', -120, -120)]),
+        ({'from': '2025-05-04'}, []),
+        ({'granularity': 'week'}, [('2025-04-28', -70, -70)]),
+        ({'granularity': 'month', 'from': '2025-05-02'}, [('2025-05-01', 50, -70)]),
+    ])
+    def test_get_window(self, client: TestClient, auth_user: AuthUser, init_transactions, params, expected):
+        response = client.get('/balance', params=params)
+        assert response.status_code == HTTP_200_OK
+        assert response.json()['balances'] == [{'date': d, 'amount': a, 'cumulative': c} for d, a, c in expected]
+
+    def test_get_exact_sums(self, client: TestClient, auth_user: AuthUser, account: dict):
+        user_id = client.put('/accounts/checking', json=account).json()['users'][0]['id']
+        for amount in (0.1, 0.2):
+            client.post('/transactions', json={
+                'name': 'Coffee',
+                'debits': [{'amount': amount, 'date': '2025-05-01', 'accountUserId': user_id}],
+                'credits': [{'amount': amount, 'date': '2025-05-01'}],
+            })
+
+        assert client.get('/balance').json()['balances'] == [{'date': '2025-05-01', 'amount': -0.3, 'cumulative': -0.3}]
+        assert client.get('/balance', params={'asOf': '2025-05-01'}).json()['balance'] == -0.3
+
+    def test_get_account_window(self, client: TestClient, auth_user: AuthUser, init_transactions):
+        response = client.get('/accounts/checking/balance', params={'from': '2025-05-02'})
+        data = response.json()
+        assert response.status_code == HTTP_200_OK
+        assert data['balances'] == data['users'][0]['balances'] == [
+            {'date': '2025-05-03', 'amount': 50, 'cumulative': -70},
+        ]
+
+
+class TestGetAsOf:
+    @pytest.mark.parametrize('as_of,expected', [
+        ('2025-04-30', 0),
+        ('2025-05-02', -120),
+        ('2025-06-01', -70),
+    ])
+    def test_get_as_of(self, client: TestClient, auth_user: AuthUser, init_transactions, as_of, expected):
+        response = client.get('/balance', params={'asOf': as_of})
+        assert response.status_code == HTTP_200_OK
+        assert response.json() == {'asOf': as_of, 'balance': expected}
+
+    @pytest.mark.parametrize('url', ['/balance', '/accounts/checking/balance'])
+    def test_get_as_of_reads_rollup(self, client: TestClient, query_counter: QueryCounter, auth_user: AuthUser,
+                                    init_transactions, url: str):
+        # read from the daily rollup, so its cost grows with days rather than entries
+        query_counter.statements.clear()
+        assert client.get(url, params={'asOf': '2025-06-01'}).status_code == HTTP_200_OK
+        statements = '\n'.join(query_counter.statements)
+        assert DailyBalance.__tablename__ in statements
+        assert TransactionEntry.__tablename__ not in statements
+
+    def test_get_account_as_of(self, client: TestClient, auth_user: AuthUser, init_transactions):
+        response = client.get('/accounts/checking/balance', params={'asOf': '2025-05-03'})
+        data = response.json()
+        assert response.status_code == HTTP_200_OK
+        assert data['asOf'] == '2025-05-03'
+        assert data['balance'] == data['users'][0]['balance'] == -70
+        assert 'balances' not in data
+
+
+class TestCache:
+    def test_get_cached(self, client: TestClient, admin_headers: dict, auth_user: AuthUser, init_transactions):
+        hits = client.get('/health/caches', headers=admin_headers).json()['balance']['hits']
+        data = client.get('/balance').json()
+        assert client.get('/balance').json() == data
+        assert client.get('/health/caches', headers=admin_headers).json()['balance']['hits'] == hits + 1
+
+        # parameters are part of the key
+        assert client.get('/balance', params={'granularity': 'month'}).json() != data
+        assert client.get('/health/caches', headers=admin_headers).json()['balance']['hits'] == hits + 1
+
+    def test_get_after_write(self, client: TestClient, admin_headers: dict, auth_user: AuthUser, init_transactions,
+                             transaction):
+        data = client.get('/accounts/checking/balance').json()
+        stats = client.get('/health/caches', headers=admin_headers).json()['balance']
+        assert stats['size'] >= 1
+        assert 0 <= stats['hitRate'] <= 1
+
+        transaction['debits'][0]['accountUserId'] = data['users'][0]['id']
+        client.post('/transactions', json=transaction)
+
+        assert client.get('/health/caches', headers=admin_headers).json()['balance']['size'] == 0
+        assert client.get('/accounts/checking/balance').json() != data
+
+    def test_write_notifies(self, session: Session, client: TestClient, auth_user: AuthUser, transaction):
+        connection = session.get_bind().raw_connection()
+        try:
+            connection.set_isolation_level(0)
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {DATA_CHANGE_CHANNEL}')
+
+            client.post('/transactions', json=transaction)
+
+            connection.poll()
+            assert [n.payload for n in connection.notifies] == [auth_user.id]
+        finally:
+            connection.close()
+
+    def test_evicted_by_other_worker(self, session: Session, client: TestClient, admin_headers: dict,
+                                     auth_user: AuthUser, init_transactions):
+        client.get('/balance')
+        assert client.get('/health/caches', headers=admin_headers).json()['balance']['size'] == 1
+
+        # as bump_data_version does from another worker
+        session.exec(text('SELECT pg_notify(:channel, :user_id)'),
+                     params={'channel': DATA_CHANGE_CHANNEL, 'user_id': auth_user.id})
+        session.commit()
+
+        deadline = time() + 5
+        while client.get('/health/caches', headers=admin_headers).json()['balance']['size'] and time() < deadline:
+            sleep(0.05)
+        assert client.get('/health/caches', headers=admin_headers).json()['balance']['size'] == 0
+
+    def test_session_evicted_by_other_worker(self, session: Session, client: TestClient, admin_headers: dict,
+                                             session_token: str):
+        client.get('/balance')
+        assert client.get('/health/caches', headers=admin_headers).json()['auth']['size'] == 1
+
+        # as the trigger on `authjs.session` does when Auth.js signs it out
+        session.exec(text('SELECT pg_notify(:channel, :session_token)'),
+                     params={'channel': SESSION_CHANGE_CHANNEL, 'session_token': session_token})
+        session.commit()
+
+        deadline = time() + 5
+        while client.get('/health/caches', headers=admin_headers).json()['auth']['size'] and time() < deadline:
+            sleep(0.05)
+        assert client.get('/health/caches', headers=admin_headers).json()['auth']['size'] == 0
+
+    def test_listener_survives_unexpected_errors(self, monkeypatch: pytest.MonkeyPatch):
+        attempts = 0
+
+        async def connect(dsn):
+            nonlocal attempts
+            attempts += 1
+            raise RuntimeError('unexpected')
+
+        monkeypatch.setattr(caches.asyncpg, 'connect', connect)
+        monkeypatch.setattr(caches, 'LISTEN_RECONNECT_DELAY', 0)
+
+        async def listen_briefly():
+            listener = asyncio.create_task(caches.listen_for_data_changes('postgresql://localhost/adfire'))
+            while attempts < 3:
+                await asyncio.sleep(0)
+            assert not listener.done()
+            listener.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await listener
+
+        asyncio.run(asyncio.wait_for(listen_briefly(), timeout=5))
+
+
+class TestRollup:
+    def test_verify_and_rebuild(self, session: Session, client: TestClient, auth_user: AuthUser, init_transactions):
+        assert asyncio.run(rollup_main('verify', None)) == 0
+
+        session.exec(delete(DailyBalance))
+        session.commit()
+        assert asyncio.run(rollup_main('verify', auth_user.id)) == 1
+
+        assert asyncio.run(rollup_main('rebuild', auth_user.id)) == 0
+        assert asyncio.run(rollup_main('verify', None)) == 0
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from time import time
+from typing import Callable, Generic, Hashable, TypeVar
+
+from app.base.models import CacheStats
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Bounded in-process LRU cache whose entries expire after `ttl` seconds,
+    or earlier when a deadline is given on `set`. Not shared across workers.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: K, value: V, expires_at: float | None = None):
+        """Stores `value` until `expires_at` (in `clock` time) or the TTL, whichever comes first."""
+        deadline = self.clock() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+
+        self._entries[key] = (deadline, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        entry = self._entries.pop(key, None)
+        return None if entry is None else entry[1]
+
+    def evict(self, predicate: Callable[[K, V], bool]) -> int:
+        """Removes every entry matching `predicate` and returns how many were removed."""
+        keys = [k for k, (_, v) in self._entries.items() if predicate(k, v)]
+        for k in keys:
+            del self._entries[k]
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        lookups = self.hits + self.misses
+        return CacheStats(size=len(self._entries), maxsize=self.maxsize, hits=self.hits, misses=self.misses,
+                          hit_rate=self.hits / lookups if lookups else 0)
@@ -1,9 +1,12 @@
 from datetime import date
+from decimal import Decimal
+from typing import Literal, Annotated, Any
 
-from pydantic import BaseModel
+from annotated_types import Gt, Interval
+from pydantic import BaseModel, FiniteFloat, WrapValidator, PlainSerializer, ValidatorFunctionWrapHandler
 from pydantic import ConfigDict
 from pydantic.alias_generators import to_camel
-from sqlmodel import SQLModel
+from sqlmodel import SQLModel, Field
 
 
 class CoreBase(SQLModel):
@@ -12,6 +15,14 @@ class CoreBase(SQLModel):
 class AuthBase(SQLModel):
     __table_args__ = {'schema': 'authjs'}
 
+class DataVersion(CoreBase, table=True):
+    """Counts the writes to the data of a user, to tell whether reads of it can be served from cache."""
+    __tablename__ = 'data_version'
+
+    user_id: str = Field(foreign_key='authjs.user.id', ondelete='CASCADE', primary_key=True)
+    version: int
+
+
 class RouteBase(BaseModel):
     model_config = ConfigDict(
         alias_generator=to_camel,
@@ -21,7 +32,56 @@ class RouteBase(BaseModel):
     )
 
 
+# Largest amount in dollars, whose cents fit a bigint with room for sums of many of them
+MAX_DOLLARS = 10 ** 15
+
+
+def to_cents(dollars: float) -> int:
+    cents = Decimal(str(dollars)) * 100
+    if cents != cents.to_integral_value():
+        raise ValueError('Amounts have at most 2 decimal places')
+    return int(cents)
+
+
+def to_dollars(cents: int) -> float:
+    return cents / 100
+
+
+class Cents(int):
+    """An amount already in cents, which `Money` fields take as is instead of converting it from dollars."""
+
+
+def parse_money(value: Any, handler: ValidatorFunctionWrapHandler) -> int:
+    if isinstance(value, Cents):
+        return int(value)
+    return to_cents(handler(value))
+
+
+# Amounts are held in integer cents, but read from and written to the API in dollars. Responses are
+# dumped and validated again before being sent, so plain numbers are always taken as dollars.
+Money = Annotated[FiniteFloat, Interval(ge=-MAX_DOLLARS, le=MAX_DOLLARS), WrapValidator(parse_money),
+                  PlainSerializer(to_dollars, return_type=float)]
+PositiveMoney = Annotated[Money, Gt(0)]
+
+Granularity = Literal['day', 'week', 'month']
+
+
 class TimeSeries(RouteBase):
     date: date
-    amount: float
-    cumulative: float
+    amount: Money
+    cumulative: Money
+
+
+class PoolStatus(RouteBase):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+
+
+class CacheStats(RouteBase):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    hit_rate: float
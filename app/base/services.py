@@ -1,3 +1,5 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from typing import Any
 
 
@@ -60,3 +62,19 @@ def table_args(
             return tuple(args)
     else:
         return kwargs
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encodes the sort key of the last row of a page into an opaque cursor."""
+    return urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    try:
+        return json.loads(urlsafe_b64decode(cursor.encode()))
+    except ValueError as e:
+        raise InvalidCursor(f'Invalid cursor {cursor!r}') from e
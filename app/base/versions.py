@@ -0,0 +1,55 @@
+"""
+Per-user data versions, which every write service bumps in the transaction it commits, so that reads
+can answer `If-None-Match` without running their queries, and workers can tell when to evict caches.
+"""
+import hashlib
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.base.models import DataVersion
+
+CHANGED_USER_IDS = 'changed_user_ids'
+
+# Notified with the id of every user whose data version is bumped, once the bump commits
+DATA_CHANGE_CHANNEL = 'adfire_data_changed'
+
+
+async def bump_data_version(db: AsyncSession, user_id: str):
+    """Marks the data of `user_id` as changed in the current transaction of `db`; the caller commits."""
+    stmt = insert(DataVersion).values(user_id=user_id, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DataVersion.user_id],
+        set_={'version': DataVersion.version + 1}
+    ).returning(func.pg_notify(DATA_CHANGE_CHANNEL, DataVersion.user_id))
+    await db.exec(stmt)
+    # read back after commit, to evict what this worker computed from the previous version without
+    # waiting for the notification that reaches the other workers
+    db.info.setdefault(CHANGED_USER_IDS, set()).add(user_id)
+
+
+def pop_changed_user_ids(session: Session) -> set[str]:
+    """Returns the users whose data version `session` bumped since it last committed or rolled back."""
+    return session.info.pop(CHANGED_USER_IDS, set())
+
+
+async def get_data_version(db: AsyncSession, user_id: str) -> int:
+    version = (await db.exec(select(DataVersion.version).where(DataVersion.user_id == user_id))).one_or_none()
+    return version or 0
+
+
+def make_etag(user_id: str, version: int) -> str:
+    # the user is part of the tag so a browser shared between users never revalidates another's data
+    digest = hashlib.sha256(f'{user_id}:{version}'.encode()).hexdigest()[:16]
+    return f'W/"{digest}"'
+
+
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    """Compares `etag` to an `If-None-Match` header with the weak comparison it calls for."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in tags
@@ -0,0 +1,89 @@
+"""
+In-process caches of this worker, and their eviction after commits that change the data they hold,
+whether made by this worker or, through `listen_for_data_changes`, by any other.
+"""
+import asyncio
+import logging
+
+import asyncpg
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.auth.models import SESSION_CHANGE_CHANNEL
+from app.auth.services import get_auth_cache, invalidate_session_token
+from app.balance.services import get_balance_cache, invalidate_balance_cache
+from app.base.models import CacheStats
+from app.base.versions import pop_changed_user_ids, DATA_CHANGE_CHANNEL
+from app.db import get_asyncpg_dsn
+
+# Seconds between checks that the listening connection is alive, and before reconnecting it
+LISTEN_KEEPALIVE = 30
+LISTEN_RECONNECT_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_stats() -> dict[str, CacheStats]:
+    return {
+        'auth': get_auth_cache().stats(),
+        'balance': get_balance_cache().stats(),
+    }
+
+
+def evict_user_data(user_id: str):
+    """Forgets everything this worker computed from the data of user `user_id`."""
+    invalidate_balance_cache(user_id)
+
+
+def evict_all_user_data():
+    get_balance_cache().clear()
+
+
+@event.listens_for(Session, 'after_commit')
+def evict_after_commit(session: Session):
+    for user_id in pop_changed_user_ids(session):
+        evict_user_data(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_after_rollback(session: Session):
+    pop_changed_user_ids(session)
+
+
+def on_data_change(connection, pid: int, channel: str, user_id: str):
+    evict_user_data(user_id)
+
+
+def on_session_change(connection, pid: int, channel: str, session_token: str):
+    invalidate_session_token(session_token)
+
+
+async def listen_for_data_changes(database_url: str):
+    """
+    Evicts what this worker cached from the data of users as other workers change it, and the sessions
+    that are signed out, until cancelled.
+    Holds its own connection rather than one from the pool, and reconnects whenever it drops or fails.
+    """
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(get_asyncpg_dsn(database_url))
+            await connection.add_listener(DATA_CHANGE_CHANNEL, on_data_change)
+            await connection.add_listener(SESSION_CHANGE_CHANNEL, on_session_change)
+            # changes and sign outs made while disconnected were never heard of
+            evict_all_user_data()
+            get_auth_cache().clear()
+
+            while True:
+                await asyncio.sleep(LISTEN_KEEPALIVE)
+                await connection.execute('SELECT 1')
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            logger.warning('Listening for data changes dropped, reconnecting: %s', e)
+        except Exception:
+            # anything else would otherwise end eviction across workers for the life of the process
+            logger.exception('Listening for data changes failed, reconnecting')
+        finally:
+            if connection:
+                connection.terminate()
+
+        await asyncio.sleep(LISTEN_RECONNECT_DELAY)
@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -6,7 +7,22 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     app_name: str = 'Adfire API'
     auth_secret: str
+    auth_strategy: Literal['database', 'jwt'] = 'database'
     database_url: str
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800
+    auth_cache_size: int = 10_000
+    auth_cache_ttl: float = 60
+    balance_cache_size: int = 1_000
+    balance_cache_ttl: float = 300
+    server_timing: bool = False
+    admin_token: str | None = None
+    profile_sample_rate: float = 0
+    profile_interval: float = 0.001
+    profile_dir: str = 'profiles'
+    profile_keep: int = 100
 
     model_config = SettingsConfigDict(env_file='.env.local')
 
@@ -9,10 +9,12 @@ from sqlmodel import Session, SQLModel, create_engine
 from starlette.testclient import TestClient
 
 from app.auth.models import AuthSession, AuthUser
+from app.auth.services import get_auth_cache
+from app.balance.services import get_balance_cache
 from app.base.models import AuthBase, CoreBase
 from app.config import get_settings
+from app.db import QueryCounter
 from app.deps import Cookies
-from app.deps import get_db_session
 from app.main import app
 
 
@@ -74,15 +76,65 @@ def session(auth_session: AuthSession):
 
 @pytest.fixture
 def client(session: Session, cookies: Cookies):
-    def get_session_override():
-        return session
+    # every test starts from a new database, where data versions start over
+    get_auth_cache().clear()
+    get_balance_cache().clear()
 
-    app.dependency_overrides[get_db_session] = get_session_override
+    # Entering the client runs the lifespan, so requests share its engine and event loop
+    with TestClient(app, cookies=cookies) as client:
+        yield client
 
-    client = TestClient(app, cookies=cookies)
-    yield client
 
-    app.dependency_overrides.clear()
+@pytest.fixture
+def admin_headers(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(get_settings(), 'admin_token', 'admin')
+    return {'X-Admin-Token': 'admin'}
+
+
+@pytest.fixture
+def query_counter(client: TestClient):
+    counter = QueryCounter(client.app.state.engine)
+    with counter.counting():
+        yield counter
+
+
+def seed_ledger(client: TestClient) -> tuple[list[str], str]:
+    """
+    Seeds 3 accounts of 2 users each, a merchant and 12 transactions between them, returning the ids of
+    the account users and of the merchant's user.
+    """
+    user_ids = []
+    for i in range(3):
+        account = client.put(f'/accounts/a{i}', json={
+            'name': f'Account {i}',
+            'users': [{'name': 'John Doe', 'mask': f'{i}0'}, {'name': 'Jane Doe', 'mask': f'{i}1'}],
+        }).json()
+        user_ids += [u['id'] for u in account['users']]
+    merchant = client.put('/accounts/merchant', json={
+        'name': 'Merchant',
+        'isMerchant': True,
+        'users': [{'name': 'Merchant', 'mask': '9999'}],
+    }).json()
+    merchant_user_id = merchant['users'][0]['id']
+
+    for i in range(12):
+        day = f'2025-05-{i + 1:02}'
+        client.post('/transactions', json={
+            'name': f'Transaction {i}',
+            'debits': [{'amount': 10 + i, 'date': day, 'accountUserId': user_ids[i % len(user_ids)]}],
+            'credits': [{'amount': 10 + i, 'date': day, 'accountUserId': merchant_user_id}],
+        })
+
+    return user_ids, merchant_user_id
+
+
+@pytest.fixture
+def init_ledger(client: TestClient, auth_user: AuthUser):
+    """Seeds enough accounts, users and transactions that a lazy load per row would blow any budget."""
+    seed_ledger(client)
+    # resolve the session once so the auth lookup is cached and not counted by tests
+    client.get('/whoami')
+    yield
 
 
 @pytest.fixture
@@ -0,0 +1,93 @@
+from contextlib import contextmanager
+from time import perf_counter
+
+from prometheus_client import Histogram
+from sqlalchemy import URL, make_url, event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.base.models import PoolStatus
+from app.config import Settings
+
+POOL_WAIT = Histogram('db_pool_wait_seconds', 'Time to get a connection from the pool, including opening it',
+                      buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+
+
+class ObservedQueuePool(AsyncAdaptedQueuePool):
+    """Pool recording how long checkouts wait for a connection."""
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(perf_counter() - started)
+
+
+def get_async_database_url(database_url: str) -> URL:
+    """Returns `database_url` with its driver swapped for asyncpg."""
+    return make_url(database_url).set(drivername='postgresql+asyncpg')
+
+
+def get_asyncpg_dsn(database_url: str) -> str:
+    """Returns `database_url` as a DSN for connecting with asyncpg directly, outside of the engine."""
+    return make_url(database_url).set(drivername='postgresql').render_as_string(hide_password=False)
+
+
+def create_db_engine(settings: Settings) -> AsyncEngine:
+    """Creates the process-wide engine whose pool is shared by every request."""
+    return create_async_engine(
+        get_async_database_url(settings.database_url),
+        poolclass=ObservedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_recycle=settings.db_pool_recycle,
+    )
+
+
+def create_db_session(engine: AsyncEngine) -> AsyncSession:
+    # Objects stay usable after commit since async sessions cannot lazily refresh them
+    return AsyncSession(engine, expire_on_commit=False)
+
+
+class QueryCounter:
+    """Records the SQL statements an engine sends while counting, for query budgets in tests and benchmarks."""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine.sync_engine
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @contextmanager
+    def counting(self):
+        event.listen(self.engine, 'before_cursor_execute', self)
+        try:
+            yield
+        finally:
+            event.remove(self.engine, 'before_cursor_execute', self)
+
+    @contextmanager
+    def budget(self, max_queries: int):
+        """Fails if the block sends more than `max_queries` statements."""
+        self.statements.clear()
+        yield
+        assert len(self.statements) <= max_queries, \
+            f'{len(self.statements)} queries over budget of {max_queries}:\n' + '\n\n'.join(self.statements)
+
+
+def get_pool_status(engine: AsyncEngine) -> PoolStatus:
+    pool = engine.pool
+    return PoolStatus(
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        overflow=pool.overflow(),
+    )
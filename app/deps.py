@@ -1,17 +1,24 @@
+import secrets
 from typing import Annotated
 
-from fastapi import Cookie, HTTPException, Depends
+from fastapi import Cookie, HTTPException, Depends, Header, Request, Response
 from pydantic import BaseModel
-from sqlmodel import Session, select
-from sqlmodel import create_engine
-from starlette.status import HTTP_401_UNAUTHORIZED
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_304_NOT_MODIFIED, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND
 
 from app.auth.models import AuthSession, AuthUser
+from app.auth.services import get_auth_cache, cache_auth_session, SESSION_COOKIE, InvalidSessionToken, \
+    is_session_jwe, get_jwt_auth_user
+from app.base.versions import get_data_version, make_etag, etag_matches
 from app.config import get_settings
+from app.db import create_db_session
+from app.timing import timed
 
 
 class Cookies(BaseModel):
-    session_token: str = Cookie(alias='authjs.session-token')
+    session_token: str = Cookie(alias=SESSION_COOKIE)
 
 
 def get_cookies(cookies: Annotated[Cookies, Cookie()]):
@@ -21,27 +28,85 @@ def get_cookies(cookies: Annotated[Cookies, Cookie()]):
 CookiesDep = Annotated[Cookies, Depends(get_cookies)]
 
 
-def get_db_session():
-    engine = create_engine(get_settings().database_url)
-    with Session(engine) as session:
+def get_engine(request: Request) -> AsyncEngine:
+    return request.app.state.engine
+
+
+EngineDep = Annotated[AsyncEngine, Depends(get_engine)]
+
+
+async def get_db_session(engine: EngineDep):
+    async with create_db_session(engine) as session:
         yield session
 
 
-DBSessionDep = Annotated[Session, Depends(get_db_session)]
+DBSessionDep = Annotated[AsyncSession, Depends(get_db_session)]
+
 
+async def get_auth_user(db: DBSessionDep, cookies: CookiesDep):
+    with timed('auth'):
+        return await resolve_auth_user(db, cookies)
 
-def get_auth_user(db: DBSessionDep, cookies: CookiesDep):
-    result = db.exec(
+
+async def resolve_auth_user(db: AsyncSession, cookies: Cookies) -> AuthUser:
+    if get_settings().auth_strategy == 'jwt' and is_session_jwe(cookies.session_token):
+        try:
+            return get_jwt_auth_user(cookies.session_token)
+        except InvalidSessionToken as e:
+            raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail=str(e))
+
+    user = get_auth_cache().get(cookies.session_token)
+    if user:
+        return user
+
+    result = (await db.exec(
         select(AuthSession, AuthUser)
         .join(AuthUser)
         .where(AuthSession.session_token == cookies.session_token)
-    ).one_or_none()
+    )).one_or_none()
 
     if not result:
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail='Invalid session token')
 
     auth_session, user = result
+    cache_auth_session(auth_session, user)
     return user
 
 
 AuthUserDep = Annotated[AuthUser, Depends(get_auth_user)]
+
+
+async def check_data_version(
+        request: Request,
+        response: Response,
+        db: DBSessionDep,
+        auth_user: AuthUserDep
+) -> int | None:
+    """
+    Answers a GET with `304 Not Modified` when its `If-None-Match` has the ETag of the current data
+    version of `auth_user`, before the route runs any of its queries. Otherwise tags the response and
+    returns the version.
+    """
+    if request.method != 'GET':
+        return None
+
+    version = await get_data_version(db, auth_user.id)
+    etag = make_etag(auth_user.id, version)
+    # stored by the browser, but always revalidated
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag_matches(etag, request.headers.get('If-None-Match')):
+        raise HTTPException(status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return version
+
+
+DataVersionDep = Annotated[int, Depends(check_data_version)]
+
+
+def check_admin_token(admin_token: str | None = Header(None, alias='X-Admin-Token')):
+    expected = get_settings().admin_token
+    if not expected:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    if not admin_token or not secrets.compare_digest(admin_token.encode(), expected.encode()):
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail='Invalid admin token')
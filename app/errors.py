@@ -1,6 +1,9 @@
 from fastapi import HTTPException, FastAPI
 from sqlalchemy.exc import IntegrityError, NoResultFound
-from starlette.status import HTTP_409_CONFLICT, HTTP_404_NOT_FOUND
+from starlette.status import HTTP_409_CONFLICT, HTTP_404_NOT_FOUND, HTTP_400_BAD_REQUEST
+
+from app.base.services import InvalidCursor
+from app.transactions.statements import InvalidStatement
 
 
 def add_error_handlers(app: FastAPI):
@@ -11,3 +14,11 @@ def add_error_handlers(app: FastAPI):
     @app.exception_handler(NoResultFound)
     async def noresult_error_handler(request, exc):
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=str(exc))
+
+    @app.exception_handler(InvalidCursor)
+    async def invalid_cursor_error_handler(request, exc):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(exc))
+
+    @app.exception_handler(InvalidStatement)
+    async def invalid_statement_error_handler(request, exc):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(exc))
@@ -1,30 +1,85 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
+from fastapi import Depends, FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from app.accounts.routes import router as accounts_router
 from app.auth.models import AuthUser
 from app.balance.routes import router as balance_router
-from app.deps import AuthUserDep
+from app.caches import get_cache_stats, listen_for_data_changes
+from app.base.models import PoolStatus, CacheStats
+from app.config import get_settings
+from app.db import create_db_engine, get_pool_status
+from app.deps import AuthUserDep, EngineDep, check_admin_token
 from app.errors import add_error_handlers
+from app.metrics import MetricsMiddleware, observe_engine, forget_worker, render_metrics
+from app.profiling import ProfilingMiddleware, router as profiles_router
+from app.timing import TimedRoute, ServerTimingMiddleware, instrument_engine, enable_timing_log
 from app.transactions.routes import router as transactions_router
 
-app = FastAPI()
+CORS_ORIGINS = ['http://localhost:3000']
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+    app.state.engine = create_db_engine(settings)
+    observe_engine(app.state.engine)
+    if settings.server_timing:
+        instrument_engine(app.state.engine)
+        enable_timing_log()
+    listener = asyncio.create_task(listen_for_data_changes(settings.database_url))
+    yield
+    listener.cancel()
+    with suppress(asyncio.CancelledError):
+        await listener
+    await app.state.engine.dispose()
+    forget_worker()
+
+
+app = FastAPI(lifespan=lifespan)
+app.router.route_class = TimedRoute
 
 add_error_handlers(app)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=['http://localhost:3000'],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=['*'],
     allow_headers=['*'],
+    expose_headers=['X-Next-Cursor', 'ETag', 'Server-Timing', 'X-Profile-Id'],
 )
+app.add_middleware(ServerTimingMiddleware, allow_origins=CORS_ORIGINS)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 app.include_router(accounts_router)
 app.include_router(transactions_router)
 app.include_router(balance_router)
+app.include_router(profiles_router)
 
 
 @app.get('/whoami')
 async def whoami(auth_user: AuthUserDep) -> AuthUser:
     return auth_user
+
+
+@app.get('/health/pool', dependencies=[Depends(check_admin_token)])
+async def pool_status(engine: EngineDep) -> PoolStatus:
+    """Returns connection pool usage of this worker."""
+    return get_pool_status(engine)
+
+
+@app.get('/health/caches', dependencies=[Depends(check_admin_token)])
+async def cache_stats() -> dict[str, CacheStats]:
+    """Returns usage of the in-process caches of this worker."""
+    return get_cache_stats()
+
+
+@app.get('/metrics', include_in_schema=False, dependencies=[Depends(check_admin_token)])
+async def metrics() -> Response:
+    """Returns the metrics of every worker in Prometheus text format."""
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,108 @@
+"""
+Prometheus metrics of this worker: request latency and concurrency, connection pool usage, SQL statements
+and cache usage.
+
+With `PROMETHEUS_MULTIPROC_DIR` set to an empty directory before the app starts, every worker writes its
+metrics there and `/metrics` aggregates those of all of them, whichever worker serves it. Gauges only sum
+the workers still alive, and cache counts are cumulative per worker, so hit rates are best computed as
+`sum(cache_hits) / (sum(cache_hits) + sum(cache_misses))`.
+
+The time checkouts wait for a pool connection is recorded by the pool of `app.db`.
+"""
+import os
+from time import perf_counter
+
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from app.caches import get_cache_stats
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time to respond to a request, until its body is sent',
+                             ['method', 'route', 'status'])
+REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests being served', multiprocess_mode='livesum')
+
+POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Connections checked out of the pool', multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('db_pool_overflow', 'Connections open beyond the pool size', multiprocess_mode='livesum')
+QUERIES = Counter('db_queries', 'SQL statements sent')
+
+CACHE_HITS = Gauge('cache_hits', 'Lookups served by a cache', ['cache'], multiprocess_mode='livesum')
+CACHE_MISSES = Gauge('cache_misses', 'Lookups missed by a cache', ['cache'], multiprocess_mode='livesum')
+CACHE_SIZE = Gauge('cache_size', 'Entries held by a cache', ['cache'], multiprocess_mode='livesum')
+
+
+def is_multiprocess() -> bool:
+    return 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+
+def observe_engine(engine: AsyncEngine):
+    """Counts the statements `engine` sends, and the connections checked out of its pool."""
+    pool = engine.pool
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CHECKED_OUT.inc()
+        POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+    def on_checkin(dbapi_connection, connection_record):
+        POOL_CHECKED_OUT.dec()
+        POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+    event.listen(pool, 'checkout', on_checkout)
+    event.listen(pool, 'checkin', on_checkin)
+    event.listen(engine.sync_engine, 'before_cursor_execute', lambda *args: QUERIES.inc())
+
+
+def observe_caches():
+    for name, stats in get_cache_stats().items():
+        CACHE_HITS.labels(name).set(stats.hits)
+        CACHE_MISSES.labels(name).set(stats.misses)
+        CACHE_SIZE.labels(name).set(stats.size)
+
+
+def forget_worker():
+    """Drops the gauges of this worker from the aggregate, as it shuts down."""
+    if is_multiprocess():
+        mark_process_dead(os.getpid())
+
+
+def render_metrics() -> bytes:
+    # caches change outside of requests too, as other workers notify of writes
+    observe_caches()
+    if not is_multiprocess():
+        return generate_latest(REGISTRY)
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # the path template rather than the path, so ids do not each get their own series
+            route = scope.get('route')
+            REQUEST_DURATION.labels(scope['method'], route.path if route else 'unmatched', status) \
+                .observe(perf_counter() - started)
+            observe_caches()
@@ -0,0 +1,133 @@
+"""
+Statistical CPU profiles of single requests, taken when a request carries `X-Profile` with the admin token,
+or at random for a `profile_sample_rate` fraction of requests. Profiles are written to `profile_dir` as
+folded stacks, which flamegraph.pl, inferno and speedscope read, and are listed and served under
+`/admin/profiles`. The id of a request's profile is sent back in `X-Profile-Id`.
+
+Only one request per worker is profiled at a time. Requests that are not pay for a settings lookup, and
+when `admin_token` is set, for a scan of their headers looking for `X-Profile`.
+"""
+import asyncio
+import random
+import re
+import secrets
+from datetime import datetime
+from pathlib import Path
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from pyinstrument import Profiler
+from pyinstrument.frame import Frame
+from pyinstrument.session import Session
+from starlette.status import HTTP_404_NOT_FOUND
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from app.config import get_settings
+from app.deps import check_admin_token
+from app.timing import TimedRoute
+
+PROFILE_HEADER = 'x-profile'
+PROFILE_ID_PATTERN = re.compile(r'[0-9]{8}T[0-9]{12}-[a-z]+-[0-9a-z_-]+')
+
+
+def render_folded(session: Session) -> str:
+    """Renders `session` as folded stacks, one line per leaf with its microseconds."""
+    lines = []
+
+    def walk(frame: Frame, stack: list[str]):
+        if frame.is_synthetic:
+            # the time a frame spent in itself rather than in a callee, or awaiting
+            name = None if frame.function == '[self]' else frame.function
+        else:
+            name = f'{frame.function} ({frame.file_path_short}:{frame.line_no})'.replace(';', ',')
+        stack = stack + [name] if name else stack
+
+        if not frame.children:
+            weight = round(frame.time * 1e6)
+            if weight:
+                lines.append(';'.join(stack) + f' {weight}')
+        for child in frame.children:
+            walk(child, stack)
+
+    root = session.root_frame()
+    if root:
+        walk(root, [])
+    return '\n'.join(lines) + '\n'
+
+
+def make_profile_id(method: str, path: str) -> str:
+    slug = re.sub(r'[^0-9a-z_-]+', '_', path.lower()).strip('_') or 'root'
+    return f'{datetime.now():%Y%m%dT%H%M%S%f}-{method.lower()}-{slug[:80]}'
+
+
+def write_profile(profile_dir: Path, profile_id: str, folded: str, keep: int):
+    """Writes a profile, then deletes the oldest ones beyond the `keep` most recent."""
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    (profile_dir / f'{profile_id}.folded').write_text(folded)
+    for old in sorted(profile_dir.glob('*.folded'), reverse=True)[keep:]:
+        old.unlink(missing_ok=True)
+
+
+def should_profile(scope: Scope) -> bool:
+    settings = get_settings()
+    if settings.admin_token:
+        for name, value in scope['headers']:
+            if name == PROFILE_HEADER.encode():
+                return secrets.compare_digest(value, settings.admin_token.encode())
+    return random.random() < settings.profile_sample_rate
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.profiling = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        settings = get_settings()
+        if scope['type'] != 'http' or self.profiling or not (settings.admin_token or settings.profile_sample_rate) \
+                or not should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = make_profile_id(scope['method'], scope['path'])
+
+        async def send_with_profile_id(message: Message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []), (b'x-profile-id', profile_id.encode())]
+            await send(message)
+
+        self.profiling = True
+        # samples only this request's task, so time spent on others shows as awaiting
+        profiler = Profiler(interval=settings.profile_interval, async_mode='enabled')
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            self.profiling = False
+            await asyncio.to_thread(write_profile, Path(settings.profile_dir), profile_id,
+                                    render_folded(profiler.last_session), settings.profile_keep)
+
+
+router = APIRouter(
+    prefix='/admin/profiles',
+    tags=['admin'],
+    dependencies=[Depends(check_admin_token)],
+    route_class=TimedRoute,
+)
+
+
+@router.get('/')
+async def get_all() -> list[str]:
+    """Returns the ids of the stored request profiles, most recent first."""
+    profile_dir = Path(get_settings().profile_dir)
+    return sorted((p.stem for p in profile_dir.glob('*.folded')), reverse=True)
+
+
+@router.get('/{id}', response_class=FileResponse)
+async def get(id: str):
+    """Returns the request profile with `id` as folded stacks."""
+    path = Path(get_settings().profile_dir) / f'{id}.folded'
+    if not PROFILE_ID_PATTERN.fullmatch(id) or not path.is_file():
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail='Profile not found')
+    return FileResponse(path, media_type='text/plain', filename=path.name)
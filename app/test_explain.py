@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session
+from starlette.testclient import TestClient
+
+from app.auth.models import AuthUser
+from app.auth.services import get_auth_cache
+from app.conftest import seed_ledger
+
+# statements whose plans can scan tables, as opposed to SET CONSTRAINTS and the like
+EXPLAINABLE = {'SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'}
+
+
+class PlanRecorder:
+    """Records the SQL statements sent by the app's engine, with their parameters, to explain them later."""
+
+    def __init__(self):
+        self.statements: dict[str, tuple] = {}
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        # an executemany runs the same plan for every row, so any one of them would do, but none is needed
+        # as long as the statement is also run for a single row somewhere in the test
+        if not executemany and statement.split(None, 1)[0].upper() in EXPLAINABLE:
+            self.statements.setdefault(statement, tuple(parameters))
+
+    @contextmanager
+    def recording(self, client: TestClient):
+        engine = client.app.state.engine.sync_engine
+        event.listen(engine, 'before_cursor_execute', self)
+        try:
+            yield
+        finally:
+            event.remove(engine, 'before_cursor_execute', self)
+
+
+def explain(session: Session, statement: str, parameters: tuple) -> dict:
+    """Returns the plan of `statement` for `parameters`, as the planner picks it when sequential scans are off."""
+    connection = session.connection().connection.dbapi_connection
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            # asyncpg placeholders are positional, so the statement is prepared as is and run with them
+            cursor.execute(f'PREPARE explained AS {statement}')
+            placeholders = ', '.join(['%s'] * len(parameters))
+            execute = f'EXECUTE explained({placeholders})' if parameters else 'EXECUTE explained'
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {execute}', parameters)
+            return cursor.fetchone()[0][0]['Plan']
+    finally:
+        session.rollback()
+        with connection.cursor() as cursor:
+            cursor.execute('DEALLOCATE ALL')
+
+
+def find_seq_scans(plan: dict) -> list[str]:
+    """Returns the relations scanned sequentially anywhere in `plan`."""
+    scans = [plan['Relation Name']] if plan['Node Type'] == 'Seq Scan' else []
+    for child in plan.get('Plans', []):
+        scans += find_seq_scans(child)
+    return scans
+
+
+@pytest.fixture
+def plan_recorder():
+    return PlanRecorder()
+
+
+@pytest.fixture
+def init_writes(client: TestClient, auth_user: AuthUser, plan_recorder: PlanRecorder):
+    """Seeds a ledger and goes through every other write route, recording their statements along the way."""
+    with plan_recorder.recording(client):
+        user_ids, merchant_user_id = seed_ledger(client)
+        client.post('/accounts', json={
+            'name': 'Other Merchant',
+            'isMerchant': True,
+            'users': [{'name': 'Other Merchant', 'mask': '8888'}],
+        })
+
+        transactions = [{
+            'name': f'Transaction {i}',
+            'debits': [{'amount': 10 + i, 'date': f'2025-05-{i + 1:02}', 'accountUserId': user_ids[i]}],
+            'credits': [{'amount': 10 + i, 'date': f'2025-05-{i + 1:02}', 'accountUserId': merchant_user_id}],
+        } for i in range(3)]
+        client.post('/transactions/bulk', json=transactions[1:])
+        id = client.post('/transactions', json=transactions[0]).json()['id']
+        client.put(f'/transactions/{id}', json=transactions[1])
+        client.delete(f'/transactions/{id}')
+
+        client.post(f'/transactions/import?accountUserId={user_ids[0]}',
+                    content=b'Date,Description,Amount\n2025-05-20,Coffee,-4.50\n2025-05-21,Paycheck,1000\n')
+
+        accounts = client.get('/accounts').json()
+        accounts[0]['name'] = 'Renamed'
+        client.put('/accounts/bulk', json=accounts)
+        client.put('/accounts/a2', json={'name': 'Account 2', 'users': [{'name': 'John Doe', 'mask': '20'}]})
+        client.delete('/accounts/a1')
+    yield
+
+
+def assert_no_seq_scans(session: Session, plan_recorder: PlanRecorder):
+    assert plan_recorder.statements
+    for statement, parameters in plan_recorder.statements.items():
+        scans = find_seq_scans(explain(session, statement, parameters))
+        assert not scans, f'sequential scan of {scans} in:\n{statement}'
+
+
+def test_explain_writes(session: Session, init_writes, plan_recorder: PlanRecorder):
+    assert_no_seq_scans(session, plan_recorder)
+
+
+@pytest.mark.parametrize('url', [
+    '/whoami',
+    '/transactions',
+    '/transactions?limit=5',
+    '/transactions?accountId=a0',
+    '/transactions/export',
+    '/accounts',
+    '/accounts/a0',
+    '/balance',
+    '/balance?asOf=2025-05-06',
+    '/accounts/a0/balance',
+    '/accounts/a0/balance?asOf=2025-05-06',
+])
+def test_explain_reads(session: Session, client: TestClient, init_writes, plan_recorder: PlanRecorder, url: str):
+    plan_recorder.statements.clear()
+    # so the session token is looked up again
+    get_auth_cache().clear()
+    with plan_recorder.recording(client):
+        assert client.get(url).status_code == 200
+    assert_no_seq_scans(session, plan_recorder)
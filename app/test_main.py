@@ -1,6 +1,14 @@
+import json
+import logging
+from time import time, sleep
+
+import pytest
 from fastapi.testclient import TestClient
+from sqlmodel import Session
 
-from app.auth.models import AuthUser
+from app.auth.models import AuthUser, AuthSession
+from app.auth.services import encode_session_token, SESSION_COOKIE
+from app.config import get_settings
 
 
 def test_whoami(client: TestClient, auth_user: AuthUser):
@@ -8,3 +16,200 @@ def test_whoami(client: TestClient, auth_user: AuthUser):
     data = response.json()
     assert response.status_code == 200
     assert data['id'] == auth_user.id
+
+
+def test_pool_status(client: TestClient, admin_headers: dict):
+    response = client.get('/health/pool', headers=admin_headers)
+    data = response.json()
+    assert response.status_code == 200
+    assert data['size'] == get_settings().db_pool_size
+    assert data['checkedIn'] + data['checkedOut'] <= data['size'] + data['overflow']
+
+
+@pytest.mark.parametrize('url', ['/health/pool', '/health/caches', '/metrics'])
+def test_internals_admin_only(client: TestClient, admin_headers: dict, url: str):
+    assert client.get(url).status_code == 403
+    assert client.get(url, headers={'X-Admin-Token': 'not-admin'}).status_code == 403
+
+
+def test_whoami_cached(client: TestClient, admin_headers: dict):
+    client.get('/whoami')
+
+    hits = client.get('/health/caches', headers=admin_headers).json()['auth']['hits']
+    response = client.get('/whoami')
+    assert response.status_code == 200
+    assert client.get('/health/caches', headers=admin_headers).json()['auth']['hits'] == hits + 1
+
+
+def test_whoami_signed_out(client: TestClient, session: Session, auth_session: AuthSession):
+    assert client.get('/whoami').status_code == 200
+
+    # as Auth.js does on sign out, from outside of this app
+    session.delete(auth_session)
+    session.commit()
+
+    deadline = time() + 5
+    while (response := client.get('/whoami')).status_code == 200 and time() < deadline:
+        sleep(0.05)
+    assert response.status_code == 401
+
+
+class TestJwtSession:
+    @pytest.fixture(autouse=True)
+    def jwt_strategy(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(get_settings(), 'auth_strategy', 'jwt')
+
+    def test_whoami_jwt(self, client: TestClient):
+        token = encode_session_token({
+            'sub': 'jwt-user',
+            'name': 'jwt',
+            'email': 'jwt@adfire.com',
+            'exp': time() + 3600,
+        }, get_settings().auth_secret)
+        client.cookies.set(SESSION_COOKIE, token)
+        response = client.get('/whoami')
+        data = response.json()
+        assert response.status_code == 200
+        assert data['id'] == 'jwt-user'
+        assert data['email'] == 'jwt@adfire.com'
+
+    def test_whoami_jwt_expired(self, client: TestClient):
+        token = encode_session_token({'sub': 'jwt-user', 'exp': time() - 3600}, get_settings().auth_secret)
+        client.cookies.set(SESSION_COOKIE, token)
+        response = client.get('/whoami')
+        assert response.status_code == 401
+
+    def test_whoami_jwt_wrong_secret(self, client: TestClient):
+        token = encode_session_token({'sub': 'jwt-user', 'exp': time() + 3600}, 'not-the-secret')
+        client.cookies.set(SESSION_COOKIE, token)
+        response = client.get('/whoami')
+        assert response.status_code == 401
+
+    def test_whoami_database_fallback(self, client: TestClient, auth_user: AuthUser):
+        response = client.get('/whoami')
+        assert response.status_code == 200
+        assert response.json()['id'] == auth_user.id
+
+
+class TestDataVersion:
+    def test_not_modified(self, client: TestClient, account: dict):
+        client.post('/accounts', json=account)
+
+        response = client.get('/accounts')
+        etag = response.headers['ETag']
+        assert etag.startswith('W/"')
+
+        response = client.get('/accounts', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        assert response.content == b''
+
+    def test_modified_by_write(self, client: TestClient, account: dict, transaction: dict):
+        etag = client.get('/balance').headers['ETag']
+        client.post('/transactions', json=transaction)
+
+        response = client.get('/balance', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+        etag = response.headers['ETag']
+        client.post('/accounts', json=account)
+        assert client.get('/transactions', headers={'If-None-Match': etag}).status_code == 200
+
+    def test_weak_comparison(self, client: TestClient):
+        etag = client.get('/transactions').headers['ETag']
+        for if_none_match in (etag, etag.removeprefix('W/'), f'W/"other", {etag}', '*'):
+            assert client.get('/transactions', headers={'If-None-Match': if_none_match}).status_code == 304
+
+
+class TestServerTiming:
+    @pytest.fixture(autouse=True)
+    def server_timing(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(get_settings(), 'server_timing', True)
+
+    def test_server_timing(self, client: TestClient, caplog: pytest.LogCaptureFixture):
+        with caplog.at_level(logging.INFO, logger='app.timing'):
+            response = client.get('/accounts/')
+        assert response.status_code == 200
+
+        metrics = dict(m.split(';', 1) for m in response.headers['Server-Timing'].split(', '))
+        assert set(metrics) == {'auth', 'db', 'service', 'serialization', 'total', 'queries'}
+        # the session, then the data version and the accounts
+        assert metrics['queries'] == 'desc="3"'
+        assert response.headers['Timing-Allow-Origin'] == 'http://localhost:3000'
+
+        line = json.loads(caplog.records[-1].getMessage())
+        assert line['path'] == '/accounts/'
+        assert line['status'] == 200
+        assert line['queries'] == 3
+        assert line['total_ms'] >= line['service_ms']
+
+    def test_server_timing_exposed(self, client: TestClient):
+        response = client.get('/accounts/', headers={'Origin': 'http://localhost:3000'})
+        assert 'Server-Timing' in response.headers['Access-Control-Expose-Headers']
+
+    def test_server_timing_not_modified(self, client: TestClient):
+        etag = client.get('/accounts').headers['ETag']
+        response = client.get('/accounts', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert 'service' not in response.headers['Server-Timing']
+
+
+def test_server_timing_disabled(client: TestClient):
+    assert 'Server-Timing' not in client.get('/accounts').headers
+
+
+def test_metrics(client: TestClient, admin_headers: dict, account: dict):
+    client.post('/accounts', json=account)
+    id = client.get('/accounts').json()[0]['id']
+    client.get(f'/accounts/{id}')
+
+    response = client.get('/metrics', headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain')
+    # path templates, not paths
+    assert 'http_request_duration_seconds_count{method="GET",route="/accounts/{id}",status="200"}' in response.text
+    assert id not in response.text
+    for name in ('http_requests_in_flight', 'db_pool_checked_out', 'db_pool_overflow', 'db_pool_wait_seconds_count',
+                 'db_queries_total', 'cache_hits{cache="auth"}', 'cache_misses{cache="balance"}'):
+        assert name in response.text
+
+
+class TestProfiling:
+    @pytest.fixture(autouse=True)
+    def profiling(self, monkeypatch: pytest.MonkeyPatch, tmp_path):
+        monkeypatch.setattr(get_settings(), 'admin_token', 'admin')
+        monkeypatch.setattr(get_settings(), 'profile_dir', str(tmp_path))
+
+    def test_profile_on_demand(self, client: TestClient):
+        assert 'X-Profile-Id' not in client.get('/balance/').headers
+        assert 'X-Profile-Id' not in client.get('/balance/', headers={'X-Profile': 'not-admin'}).headers
+
+        response = client.get('/balance/', headers={'X-Profile': 'admin'})
+        assert response.status_code == 200
+        id = response.headers['X-Profile-Id']
+
+        response = client.get('/admin/profiles', headers={'X-Admin-Token': 'admin'})
+        assert response.json() == [id]
+
+        response = client.get(f'/admin/profiles/{id}', headers={'X-Admin-Token': 'admin'})
+        assert response.status_code == 200
+        for line in response.text.splitlines():
+            stack, weight = line.rsplit(' ', 1)
+            assert stack and int(weight) > 0
+
+    def test_profile_sampled(self, client: TestClient, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(get_settings(), 'profile_sample_rate', 1)
+        assert 'X-Profile-Id' in client.get('/balance/').headers
+
+    def test_profile_id_exposed(self, client: TestClient):
+        response = client.get('/balance/', headers={'X-Profile': 'admin', 'Origin': 'http://localhost:3000'})
+        assert 'X-Profile-Id' in response.headers['Access-Control-Expose-Headers']
+
+    def test_profiles_admin_only(self, client: TestClient, monkeypatch: pytest.MonkeyPatch):
+        assert client.get('/admin/profiles').status_code == 403
+        assert client.get('/admin/profiles', headers={'X-Admin-Token': 'not-admin'}).status_code == 403
+        assert client.get('/admin/profiles/..', headers={'X-Admin-Token': 'admin'}).status_code == 404
+
+        monkeypatch.setattr(get_settings(), 'admin_token', None)
+        assert client.get('/admin/profiles', headers={'X-Admin-Token': 'admin'}).status_code == 404
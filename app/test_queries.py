@@ -0,0 +1,64 @@
+import pytest
+from starlette.testclient import TestClient
+
+from app.db import QueryCounter
+
+
+# every read also looks up the data version of the user for its ETag
+@pytest.mark.parametrize('url,max_queries', [
+    ('/transactions', 2),
+    ('/transactions?limit=5', 2),
+    ('/transactions?accountId=a1', 2),
+    ('/transactions/export', 3),
+    ('/accounts', 2),
+    ('/accounts/a1', 3),
+    ('/balance', 2),
+    ('/balance?asOf=2025-05-06', 2),
+    ('/accounts/a1/balance', 5),
+    ('/accounts/a1/balance?asOf=2025-05-06', 4),
+])
+def test_query_budget(client: TestClient, query_counter: QueryCounter, init_ledger, url: str, max_queries: int):
+    with query_counter.budget(max_queries):
+        response = client.get(url)
+    assert response.status_code == 200
+
+
+def test_query_budget_get_transaction(client: TestClient, query_counter: QueryCounter, init_ledger):
+    id = client.get('/transactions').json()[0]['id']
+    with query_counter.budget(2):
+        response = client.get(f'/transactions/{id}')
+    assert response.status_code == 200
+
+
+def test_query_budget_create_bulk(client: TestClient, query_counter: QueryCounter, init_ledger, transaction):
+    # resolving account users, inserting transactions, entries, the rollup upsert and cleanup, and the data version
+    with query_counter.budget(6):
+        response = client.post('/transactions/bulk', json=[transaction] * 50)
+    assert response.status_code == 201
+
+
+def test_query_budget_upsert_bulk(client: TestClient, query_counter: QueryCounter, init_ledger):
+    accounts = client.get('/accounts').json()
+    for a in accounts:
+        a['users'].append({'name': 'Jim Doe', 'mask': '9999'})
+    accounts += [{'id': f'b{i}', 'name': f'Bulk {i}', 'users': [{'name': 'John Doe', 'mask': '0'}]} for i in range(20)]
+
+    # looking up accounts and users, deferring constraints, one write per kind of change and the data version
+    with query_counter.budget(8):
+        response = client.put('/accounts/bulk', json=accounts)
+    assert response.status_code == 200
+
+
+def test_query_budget_not_modified(client: TestClient, query_counter: QueryCounter, init_ledger):
+    etag = client.get('/accounts/a1/balance').headers['ETag']
+    with query_counter.budget(1):
+        response = client.get('/accounts/a1/balance', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_query_budget_cached_balance(client: TestClient, query_counter: QueryCounter, init_ledger):
+    client.get('/accounts/a1/balance')
+    # only the data version is looked up
+    with query_counter.budget(1):
+        response = client.get('/accounts/a1/balance')
+    assert response.status_code == 200
@@ -0,0 +1,149 @@
+"""
+Per-request timing of auth, SQL, the route's service call and response serialization, sent back in a
+`Server-Timing` header and logged as JSON to the `app.timing` logger when `server_timing` is on. When it
+is off, requests only pay for one settings lookup and one context variable read per timed phase.
+"""
+import json
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+from time import perf_counter
+from typing import Callable
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTiming:
+    """Seconds spent by one request in each phase, and the SQL statements it sent."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.durations: dict[str, float] = defaultdict(float)
+        self.queries = 0
+        self.query_started: float | None = None
+        self.service_ended: float | None = None
+
+    def add(self, phase: str, seconds: float):
+        self.durations[phase] += seconds
+
+    def header(self) -> str:
+        metrics = [f'{phase};dur={seconds * 1e3:.1f}' for phase, seconds in self.durations.items()]
+        return ', '.join(metrics + [f'queries;desc="{self.queries}"'])
+
+    def fields(self) -> dict:
+        return {f'{phase}_ms': round(seconds * 1e3, 1) for phase, seconds in self.durations.items()} \
+            | {'queries': self.queries}
+
+
+request_timing: ContextVar[RequestTiming | None] = ContextVar('request_timing', default=None)
+
+
+@contextmanager
+def timed(phase: str):
+    """Adds the time spent in the block to `phase` of the current request, if it is being timed."""
+    timing = request_timing.get()
+    if timing is None:
+        yield
+        return
+
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(phase, perf_counter() - started)
+
+
+def time_service(endpoint: Callable) -> Callable:
+    if not iscoroutinefunction(endpoint):
+        return endpoint
+
+    # signature and annotations are those of `endpoint`, which FastAPI inspects for parameters and response model
+    @wraps(endpoint)
+    async def timed_endpoint(*args, **kwargs):
+        with timed('service'):
+            result = await endpoint(*args, **kwargs)
+        timing = request_timing.get()
+        if timing is not None:
+            timing.service_ended = perf_counter()
+        return result
+
+    return timed_endpoint
+
+
+class TimedRoute(APIRoute):
+    """Route timing its endpoint as the service phase, and the rest until the response starts as serialization."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, time_service(endpoint), **kwargs)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = request_timing.get()
+    if timing is not None:
+        timing.query_started = perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = request_timing.get()
+    if timing is not None and timing.query_started is not None:
+        timing.queries += 1
+        timing.add('db', perf_counter() - timing.query_started)
+        timing.query_started = None
+
+
+def enable_timing_log():
+    """Logs the timing of requests to stderr, unless logging was configured to handle it already."""
+    logger.setLevel(logging.INFO)
+    if not logger.hasHandlers():
+        logger.addHandler(logging.StreamHandler())
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Times the statements `engine` sends for the request they are sent in."""
+    event.listen(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', after_cursor_execute)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app: ASGIApp, allow_origins: list[str] | None = None):
+        self.app = app
+        # lets these origins read the timings, which browsers otherwise hide from cross-origin requests
+        self.timing_allow_origin = ', '.join(allow_origins or []).encode()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not get_settings().server_timing:
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        status = None
+
+        async def send_with_timing(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if timing.service_ended is not None:
+                    timing.add('serialization', perf_counter() - timing.service_ended)
+                timing.add('total', perf_counter() - timing.started)
+                message['headers'] = [*message.get('headers', []), (b'server-timing', timing.header().encode())]
+                if self.timing_allow_origin:
+                    message['headers'].append((b'timing-allow-origin', self.timing_allow_origin))
+            await send(message)
+
+        token = request_timing.set(timing)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timing.reset(token)
+            logger.info(json.dumps({'method': scope['method'], 'path': scope['path'], 'status': status}
+                                   | timing.fields()))
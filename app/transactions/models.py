@@ -2,10 +2,12 @@ from datetime import date
 from typing import TYPE_CHECKING, Optional
 
 from nanoid import generate
-from pydantic import PositiveFloat
+from sqlalchemy import Index, PrimaryKeyConstraint, BigInteger
+from sqlalchemy.orm import declared_attr
 from sqlmodel import Field, Relationship
 
-from app.base.models import CoreBase, RouteBase, TimeSeries
+from app.base.models import CoreBase, RouteBase, TimeSeries, Money, PositiveMoney
+from app.base.services import table_args
 
 if TYPE_CHECKING:
     from app.accounts.models import AccountUser
@@ -18,13 +20,21 @@ class Transaction(CoreBase, table=True):
     pub_id: str = Field(index=True, unique=True, default_factory=generate)
     name: str
     date: date
-    amount: float
+    # in cents
+    amount: int = Field(sa_type=BigInteger)
 
     entries: list['TransactionEntry'] = Relationship(back_populates='transaction', cascade_delete=True,
                                                      sa_relationship_kwargs={'order_by': 'TransactionEntry.date'})
 
     owner_id: str = Field(foreign_key='authjs.user.id', ondelete='CASCADE')
 
+    @declared_attr
+    def __table_args__(cls):
+        return table_args(cls, (
+            # serves keyset pagination ordered by (date, id) within an owner
+            Index('ix_transaction_owner_id_date_id', 'owner_id', 'date', 'id'),
+        ))
+
 
 class TransactionEntry(CoreBase, table=True):
     __tablename__ = 'transaction_entry'
@@ -32,20 +42,49 @@ class TransactionEntry(CoreBase, table=True):
     id: int = Field(primary_key=True)
     pub_id: str = Field(index=True, unique=True, default_factory=generate)
     date: date
-    amount: float
+    # in cents
+    amount: int = Field(sa_type=BigInteger)
 
-    transaction_id: int = Field(foreign_key='core.transaction.id', ondelete='CASCADE')
+    transaction_id: int = Field(foreign_key='core.transaction.id', ondelete='CASCADE', index=True)
     transaction: Transaction = Relationship(back_populates='entries')
 
     account_user_id: int | None = Field(foreign_key='core.account_user.id', ondelete='SET NULL', nullable=True)
     account_user: Optional['AccountUser'] = Relationship(back_populates='entries')
 
+    @declared_attr
+    def __table_args__(cls):
+        return table_args(cls, (
+            # serves lookups of an account user's entries, like the transactions of an account
+            Index('ix_transaction_entry_account_user_id_date', 'account_user_id', 'date', postgresql_include=['amount']),
+        ))
+
+
+class TransactionFingerprint(CoreBase, table=True):
+    """Identifies a statement row imported for an account user, so importing it again is skipped."""
+    __tablename__ = 'transaction_fingerprint'
+
+    account_user_id: int = Field(foreign_key='core.account_user.id', ondelete='CASCADE')
+    date: date
+    # in cents
+    amount: int = Field(sa_type=BigInteger)
+    name: str
+    # tells apart identical rows within a statement, like two coffees on the same day
+    occurrence: int
+
+    transaction_id: int = Field(foreign_key='core.transaction.id', ondelete='CASCADE', index=True)
+
+    @declared_attr
+    def __table_args__(cls):
+        return table_args(cls, (
+            PrimaryKeyConstraint('account_user_id', 'date', 'amount', 'name', 'occurrence'),
+        ))
+
 
 # <*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*> Route Models <*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*><*>
 
 class TransactionEntryBase(RouteBase):
     date: date
-    amount: PositiveFloat
+    amount: PositiveMoney
     account_user_id: str | None = None
 
 
@@ -78,6 +117,17 @@ class TransactionEntryRead(TransactionEntryUpdate):
 class TransactionRead(TransactionUpdate):
     id: str
     date: date
-    amount: float
+    amount: Money
     debits: list[TransactionEntryRead]
     credits: list[TransactionEntryRead]
+
+
+class TransactionBulkResult(RouteBase):
+    index: int
+    id: str | None = None
+    error: str | None = None
+
+
+class TransactionImportRead(RouteBase):
+    imported: int
+    skipped: int
@@ -1,29 +1,78 @@
-from fastapi import APIRouter, Response
+from typing import Literal, Annotated
+
+from fastapi import APIRouter, Response, Body, Request, Depends
 from fastapi.params import Query
+from starlette.responses import StreamingResponse, JSONResponse
 from starlette.status import HTTP_201_CREATED
 
-from app.deps import DBSessionDep, AuthUserDep
-from app.transactions.models import TransactionRead, TransactionCreate, TransactionUpdate
-from app.transactions.services import get_all_transactions, get_transaction_by_id, create_transaction, \
-    upsert_transaction, delete_transaction, get_transactions_by_account_id
+from app.db import create_db_session
+from app.deps import check_data_version, DBSessionDep, AuthUserDep, EngineDep
+from app.transactions.models import TransactionRead, TransactionCreate, TransactionUpdate, TransactionBulkResult, \
+    TransactionImportRead
+from app.transactions.services import get_all_transactions_json, get_transaction_by_id, create_transaction, \
+    upsert_transaction, delete_transaction, get_transactions_by_account_id_json, export_transactions, \
+    dump_transactions_ndjson, dump_transactions_csv, create_transactions, import_transactions
+from app.transactions.statements import parse_csv_statement, parse_ofx_statement
+from app.timing import TimedRoute
 
 router = APIRouter(
     prefix='/transactions',
-    tags=['transactions']
+    tags=['transactions'],
+    dependencies=[Depends(check_data_version)],
+    route_class=TimedRoute,
 )
 
 
-@router.get('/')
+@router.get('/', response_model=list[TransactionRead])
 async def get_all(
         db: DBSessionDep,
         auth_user: AuthUserDep,
+        response: Response,
         account_id: str | None = Query(None, alias='accountId'),
-) -> list[TransactionRead]:
-    """Returns all transactions from `auth_user`."""
+        limit: int | None = Query(None, ge=1, le=1000),
+        cursor: str | None = None,
+) -> JSONResponse:
+    """
+    Returns transactions from `auth_user`, newest first. With `limit`, returns one page and
+    sets `X-Next-Cursor` to the `cursor` of the following page if there is one.
+    """
+    # listings are built from plain rows, so they skip validation against the response model
     if account_id:
-        return get_transactions_by_account_id(db, auth_user, account_id)
+        data, next_cursor = await get_transactions_by_account_id_json(db, auth_user, account_id, limit, cursor)
+    else:
+        data, next_cursor = await get_all_transactions_json(db, auth_user, limit, cursor)
+
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+
+    # returned as is, so headers set on `response` are passed on here
+    return JSONResponse(data, headers=response.headers)
+
+
+@router.get('/export', response_class=StreamingResponse)
+async def export(
+        engine: EngineDep,
+        auth_user: AuthUserDep,
+        format: Literal['ndjson', 'csv'] = 'ndjson',
+        account_id: str | None = Query(None, alias='accountId'),
+):
+    """Streams all transactions from `auth_user` as NDJSON, or as CSV with one row per entry."""
+
+    async def stream():
+        # the request's session is closed before the body is sent, so the export opens its own
+        async with create_db_session(engine) as db:
+            if format == 'csv':
+                yield dump_transactions_csv([], header=True)
+            async for transactions in export_transactions(db, auth_user, account_id):
+                yield dump_transactions_csv(transactions) if format == 'csv' else dump_transactions_ndjson(transactions)
 
-    return get_all_transactions(db, auth_user)
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    extension = 'csv' if format == 'csv' else 'ndjson'
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="transactions.{extension}"'}
+    )
 
 
 @router.get('/{id}')
@@ -33,7 +82,7 @@ async def get(
         id: str
 ) -> TransactionRead:
     """Returns transaction with `id` from `auth_user`."""
-    return get_transaction_by_id(db, auth_user, id)
+    return await get_transaction_by_id(db, auth_user, id)
 
 
 @router.post('/', status_code=HTTP_201_CREATED)
@@ -44,11 +93,38 @@ async def create(
         response: Response
 ) -> TransactionRead:
     """Creates a new transaction for `auth_user`."""
-    data = create_transaction(db, auth_user, body)
+    data = await create_transaction(db, auth_user, body)
     response.headers['Location'] = f'{router.prefix}/{data.id}'
     return data
 
 
+@router.post('/bulk', status_code=HTTP_201_CREATED)
+async def create_bulk(
+        db: DBSessionDep,
+        auth_user: AuthUserDep,
+        body: Annotated[list[TransactionCreate], Body(max_length=10_000)],
+) -> list[TransactionBulkResult]:
+    """Creates many transactions for `auth_user` at once, returning the id or error of each in order."""
+    return await create_transactions(db, auth_user, body)
+
+
+@router.post('/import')
+async def import_statement(
+        db: DBSessionDep,
+        auth_user: AuthUserDep,
+        request: Request,
+        account_user_id: str = Query(alias='accountUserId'),
+        format: Literal['csv', 'ofx'] = 'csv',
+) -> TransactionImportRead:
+    """
+    Imports the CSV or OFX bank statement streamed in the request body as transactions of account user
+    with `account_user_id`, skipping rows that were imported before. Rows committed before an invalid
+    one stay imported.
+    """
+    parse = parse_csv_statement if format == 'csv' else parse_ofx_statement
+    return await import_transactions(db, auth_user, account_user_id, parse(request.stream()))
+
+
 @router.put('/{id}')
 async def upsert(
         db: DBSessionDep,
@@ -57,7 +133,7 @@ async def upsert(
         body: TransactionUpdate,
 ) -> TransactionRead:
     """Upserts `body` to transaction with `id` for `auth_user`."""
-    return upsert_transaction(db, auth_user, id, body)
+    return await upsert_transaction(db, auth_user, id, body)
 
 
 @router.delete('/{id}')
@@ -67,4 +143,4 @@ async def delete(
         id: str,
 ) -> None:
     """Deletes transaction with `id` from `auth_user`."""
-    delete_transaction(db, auth_user, id)
+    await delete_transaction(db, auth_user, id)
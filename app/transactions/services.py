@@ -1,15 +1,28 @@
+import csv
+import io
+from collections import Counter
+from datetime import date, timedelta
 from itertools import groupby
-from operator import attrgetter
-from typing import Iterable, TYPE_CHECKING
+from operator import attrgetter, itemgetter
+from typing import Iterable, AsyncIterator, NamedTuple
 
-from sqlalchemy.orm import joinedload
-from sqlmodel import select, Session
+from nanoid import generate
+from sqlalchemy import Select, tuple_, func, ColumnElement, cast, Date, case, literal, insert, Row, BigInteger
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.accounts.services import get_account_users_pub_id_to_id_map
 from app.auth.models import AuthUser
-from app.base.models import TimeSeries
+from app.balance.models import DailyBalance
+from app.balance.rollup import RollupDeltas, apply_rollup_deltas
+from app.base.models import TimeSeries, Granularity, Cents, to_dollars
+from app.base.services import encode_cursor, decode_cursor, InvalidCursor
+from app.base.versions import bump_data_version
 from app.transactions.models import Transaction, TransactionEntry, TransactionRead, TransactionCreate, \
-    TransactionEntryRead, TransactionUpdate, TransactionEntryUpdate
+    TransactionEntryRead, TransactionUpdate, TransactionEntryUpdate, TransactionBulkResult, TransactionEntryCreate, \
+    TransactionFingerprint, TransactionImportRead
+from app.transactions.statements import StatementRow
 
 from app.accounts.models import AccountUser, Account
 
@@ -18,7 +31,7 @@ def map_entry(e: TransactionEntry) -> TransactionEntryRead:
     return TransactionEntryRead(
         id=e.pub_id,
         date=e.date,
-        amount=abs(e.amount),
+        amount=Cents(abs(e.amount)),
         account_user_id=None if not e.account_user else e.account_user.pub_id
     )
 
@@ -28,52 +41,117 @@ def map_transaction(transaction: Transaction, amount_relative_to_account: str =
         id=transaction.pub_id,
         name=transaction.name,
         date=min(e.date for e in transaction.entries),
-        amount=sum(
+        amount=Cents(sum(
             e.amount for e in transaction.entries
-            if not e.account_user.account.is_merchant
+            if e.account_user
+            and not e.account_user.account.is_merchant
             and (e.account_user.account.pub_id == amount_relative_to_account if amount_relative_to_account else True)
-        ),
+        )),
         debits=[map_entry(e) for e in transaction.entries if e.amount < 0],
         credits=[map_entry(e) for e in transaction.entries if e.amount >= 0],
     )
 
 
-def get_all_transactions(db: Session, auth_user: AuthUser):
+def load_transaction_entries():
+    """
+    Loader option for everything `map_transaction` reads, joined into the same query so that
+    reading any number of transactions takes one round trip and never lazy loads.
+    """
+    return (joinedload(Transaction.entries)
+            .joinedload(TransactionEntry.account_user)
+            .joinedload(AccountUser.account))
+
+
+def paginate_transactions_stmt(stmt: Select, limit: int | None, cursor: str | None) -> Select:
+    """Orders `stmt` newest first and seeks past `cursor`, fetching one extra row to detect a next page."""
+    stmt = stmt.order_by(Transaction.date.desc(), Transaction.id.desc())
+
+    if cursor:
+        try:
+            cursor_date, cursor_id = decode_cursor(cursor)
+            cursor_key = date.fromisoformat(cursor_date), int(cursor_id)
+        except (TypeError, ValueError) as e:
+            raise InvalidCursor(f'Invalid cursor {cursor!r}') from e
+        stmt = stmt.where(tuple_(Transaction.date, Transaction.id) < tuple_(*cursor_key))
+
+    if limit:
+        stmt = stmt.limit(limit + 1)
+
+    return stmt
+
+
+def page_transactions(transactions: list[Transaction], limit: int | None) -> (list[Transaction], str | None):
+    if not limit or len(transactions) <= limit:
+        return transactions, None
+
+    last = transactions[limit - 1]
+    return transactions[:limit], encode_cursor(last.date, last.id)
+
+
+async def get_all_transactions(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        limit: int | None = None,
+        cursor: str | None = None,
+) -> (list[TransactionRead], str | None):
     stmt = (select(Transaction)
-            .order_by(Transaction.date.desc())
-            .options(joinedload(Transaction.entries).joinedload(TransactionEntry.account_user))
+            .options(load_transaction_entries())
             .where(Transaction.owner_id == auth_user.id))
+    stmt = paginate_transactions_stmt(stmt, limit, cursor)
 
-    transactions = db.exec(stmt).unique().all()
+    transactions, next_cursor = page_transactions((await db.exec(stmt)).unique().all(), limit)
 
-    return [map_transaction(t) for t in transactions]
+    return [map_transaction(t) for t in transactions], next_cursor
 
 
 def get_transaction_by_id_stmt(auth_user: AuthUser, id: str):
     return (select(Transaction)
-            .options(joinedload(Transaction.entries).joinedload(TransactionEntry.account_user))
+            .options(load_transaction_entries())
             .where(Transaction.owner_id == auth_user.id)
             .where(Transaction.pub_id == id))
 
 
-def get_raw_transaction_or_none_by_id(db: Session, auth_user: AuthUser, id: str) -> Transaction | None:
-    stmt = get_transaction_by_id_stmt(auth_user, id)
-    return db.exec(stmt).unique().one_or_none()
+def lock_transaction_stmt(auth_user: AuthUser, id: str):
+    return (select(Transaction.id)
+            .where(Transaction.owner_id == auth_user.id)
+            .where(Transaction.pub_id == id)
+            .with_for_update())
 
 
-def get_raw_transaction_by_id(db: Session, auth_user: AuthUser, id: str) -> Transaction:
-    stmt = get_transaction_by_id_stmt(auth_user, id)
-    return db.exec(stmt).unique().one()
+async def get_raw_transaction_or_none_by_id(db: AsyncSession, auth_user: AuthUser, id: str) -> Transaction | None:
+    """
+    Loads transaction `id` to write it, locked until the caller commits, so that concurrent writes of
+    it take turns and each computes its rollup deltas from the entries the previous one left.
+    """
+    # locked before the entries are read, since a statement waiting on a lock still sees the other
+    # rows it reads as they were before the wait
+    if (await db.exec(lock_transaction_stmt(auth_user, id))).one_or_none() is None:
+        return None
+    stmt = get_transaction_by_id_stmt(auth_user, id).execution_options(populate_existing=True)
+    return (await db.exec(stmt)).unique().one()
+
 
+async def get_raw_transaction_by_id(db: AsyncSession, auth_user: AuthUser, id: str) -> Transaction:
+    """Same as `get_raw_transaction_or_none_by_id`, failing if there is no such transaction."""
+    (await db.exec(lock_transaction_stmt(auth_user, id))).one()
+    stmt = get_transaction_by_id_stmt(auth_user, id).execution_options(populate_existing=True)
+    return (await db.exec(stmt)).unique().one()
 
-def get_transaction_by_id(db: Session, auth_user: AuthUser, id: str) -> TransactionRead:
+
+async def get_transaction_by_id(db: AsyncSession, auth_user: AuthUser, id: str) -> TransactionRead:
     stmt = get_transaction_by_id_stmt(auth_user, id)
-    return map_transaction(db.exec(stmt).unique().one())
+    return map_transaction((await db.exec(stmt)).unique().one())
+
 
+async def reload_transaction(db: AsyncSession, auth_user: AuthUser, transaction: Transaction) -> TransactionRead:
+    """Maps `transaction` after a write, reloading the entry graph that was changed in memory."""
+    stmt = get_transaction_by_id_stmt(auth_user, transaction.pub_id).execution_options(populate_existing=True)
+    return map_transaction((await db.exec(stmt)).unique().one())
 
-def create_transaction(db: Session, auth_user: AuthUser, transaction: TransactionCreate) -> TransactionRead:
+
+async def create_transaction(db: AsyncSession, auth_user: AuthUser, transaction: TransactionCreate) -> TransactionRead:
     account_user_pub_ids = [e.account_user_id for e in transaction.debits + transaction.credits]
-    id_map = get_account_users_pub_id_to_id_map(db, auth_user, account_user_pub_ids)
+    id_map = await get_account_users_pub_id_to_id_map(db, auth_user, account_user_pub_ids)
 
     debits = [TransactionEntry(
         date=e.date,
@@ -95,21 +173,198 @@ def create_transaction(db: Session, auth_user: AuthUser, transaction: Transactio
         amount=sum(e.amount for e in credits)
     )
 
+    deltas = RollupDeltas()
+    deltas.add_entries(debits + credits)
+
     db.add(transaction)
-    db.commit()
+    await apply_rollup_deltas(db, deltas)
+    await bump_data_version(db, auth_user.id)
+    await db.commit()
 
-    return map_transaction(transaction)
+    return await reload_transaction(db, auth_user, transaction)
 
 
-def update_transaction(
-        db: Session,
+async def insert_transactions(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        transactions: list[TransactionCreate],
+        id_map: dict[str, int | None]
+) -> list[tuple[int, str]]:
+    """
+    Writes `transactions` with multi-row inserts instead of one per entity and returns the `(id, pub_id)`
+    of each in order. Entries are mapped to account users through `id_map`; the caller commits.
+    """
+    ids = (await db.exec(
+        insert(Transaction).returning(Transaction.id, Transaction.pub_id, sort_by_parameter_order=True),
+        params=[{
+            'pub_id': generate(),
+            'name': t.name,
+            'date': min(e.date for e in t.debits + t.credits),
+            'amount': sum(e.amount for e in t.credits),
+            'owner_id': auth_user.id,
+        } for t in transactions]
+    )).all()
+
+    entries = [{
+        'pub_id': generate(),
+        'date': e.date,
+        'amount': sign * e.amount,
+        'transaction_id': transaction_id,
+        'account_user_id': id_map.get(e.account_user_id),
+    } for (transaction_id, _), t in zip(ids, transactions)
+        for sign, es in ((-1, t.debits), (1, t.credits))
+        for e in es]
+    await db.exec(insert(TransactionEntry), params=entries)
+
+    deltas = RollupDeltas()
+    for e in entries:
+        deltas.add(e['account_user_id'], e['date'], e['amount'])
+    await apply_rollup_deltas(db, deltas)
+
+    return [tuple(x) for x in ids]
+
+
+async def create_transactions(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        transactions: list[TransactionCreate]
+) -> list[TransactionBulkResult]:
+    """Same as `create_transaction` for many transactions at once, in one DB transaction."""
+    account_user_pub_ids = list({e.account_user_id for t in transactions for e in t.debits + t.credits
+                                 if e.account_user_id is not None})
+    id_map = await get_account_users_pub_id_to_id_map(db, auth_user, account_user_pub_ids)
+
+    results = [TransactionBulkResult(index=i) for i in range(len(transactions))]
+    valid = []
+    for result, t in zip(results, transactions):
+        # unlike `create_transaction`, which stores them without account user
+        unknown = [e.account_user_id for e in t.debits + t.credits
+                   if e.account_user_id is not None and id_map[e.account_user_id] is None]
+        if not t.debits + t.credits:
+            result.error = 'Transaction has no entries'
+        elif unknown:
+            result.error = f'Account user {unknown[0]} not found'
+        else:
+            valid.append((result, t))
+
+    if valid:
+        ids = await insert_transactions(db, auth_user, [t for _, t in valid], id_map)
+        for (result, _), (_, pub_id) in zip(valid, ids):
+            result.id = pub_id
+        await bump_data_version(db, auth_user.id)
+        await db.commit()
+
+    return results
+
+
+IMPORT_BATCH_SIZE = 500
+
+# Identical rows are numbered within their date, and only dates this close to the row being read are
+# counted, since statements list rows in date order. Rows further out of order are numbered again.
+IMPORT_OCCURRENCE_WINDOW = timedelta(days=31)
+
+
+async def import_transactions_batch(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        account_user: AccountUser,
+        fingerprints: list[tuple[date, int, str, int]]
+) -> int:
+    """Creates a transaction for each of `fingerprints` not imported before, returning how many were."""
+    key = tuple_(TransactionFingerprint.date, TransactionFingerprint.amount,
+                 TransactionFingerprint.name, TransactionFingerprint.occurrence)
+    existing = set((await db.exec(
+        select(TransactionFingerprint.date, TransactionFingerprint.amount,
+               TransactionFingerprint.name, TransactionFingerprint.occurrence)
+        .where(TransactionFingerprint.account_user_id == account_user.id, key.in_(fingerprints))
+    )).all())
+    fingerprints = [f for f in fingerprints if f not in existing]
+    if not fingerprints:
+        return 0
+
+    transactions = []
+    for d, amount, name, _ in fingerprints:
+        # the other side of the row is not known from a statement, so it is left without account user
+        entries = ([TransactionEntryCreate(date=d, amount=Cents(abs(amount)), account_user_id=account_user.pub_id)],
+                   [TransactionEntryCreate(date=d, amount=Cents(abs(amount)))])
+        debits, credits = entries if amount < 0 else reversed(entries)
+        transactions.append(TransactionCreate(name=name, debits=debits, credits=credits))
+
+    ids = await insert_transactions(db, auth_user, transactions, {account_user.pub_id: account_user.id})
+    await db.exec(insert(TransactionFingerprint), params=[{
+        'account_user_id': account_user.id,
+        'date': d,
+        'amount': amount,
+        'name': name,
+        'occurrence': occurrence,
+        'transaction_id': transaction_id,
+    } for (d, amount, name, occurrence), (transaction_id, _) in zip(fingerprints, ids)])
+    await bump_data_version(db, auth_user.id)
+    await db.commit()
+
+    return len(fingerprints)
+
+
+async def import_transactions(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        account_user_id: str,
+        rows: AsyncIterator[StatementRow]
+) -> TransactionImportRead:
+    """
+    Creates a transaction for each statement row of the account user with `account_user_id`, committing
+    every `IMPORT_BATCH_SIZE` rows. Rows imported before, or by a failed upload, are skipped.
+
+    The import is not atomic: when a row fails to parse, the batches committed before it are kept, so
+    uploading the corrected statement again resumes where the failed upload stopped.
+    """
+    stmt = (select(AccountUser)
+            .join(Account)
+            .where(Account.owner_id == auth_user.id)
+            .where(AccountUser.pub_id == account_user_id))
+    account_user = (await db.exec(stmt)).one()
+    # returns the connection to the pool while the upload is read, so that each batch has its own
+    # short transaction rather than one staying idle for as long as the client takes to send it
+    await db.commit()
+
+    result = TransactionImportRead(imported=0, skipped=0)
+    # counts of identical rows by date, dropped once the statement has moved past their date
+    occurrences: dict[date, Counter] = {}
+    batch = []
+    async for row in rows:
+        if not row.amount:
+            result.skipped += 1
+            continue
+
+        if row.date not in occurrences:
+            occurrences = {d: c for d, c in occurrences.items() if abs(d - row.date) <= IMPORT_OCCURRENCE_WINDOW}
+            occurrences[row.date] = Counter()
+        counts = occurrences[row.date]
+        counts[row.name, row.amount] += 1
+        batch.append((row.date, row.amount, row.name, counts[row.name, row.amount] - 1))
+        if len(batch) == IMPORT_BATCH_SIZE:
+            imported = await import_transactions_batch(db, auth_user, account_user, batch)
+            result.imported += imported
+            result.skipped += len(batch) - imported
+            batch = []
+
+    if batch:
+        imported = await import_transactions_batch(db, auth_user, account_user, batch)
+        result.imported += imported
+        result.skipped += len(batch) - imported
+
+    return result
+
+
+async def update_transaction(
+        db: AsyncSession,
         auth_user: AuthUser,
         transaction: Transaction,
         transaction_in: TransactionUpdate
 ) -> TransactionRead:
     account_user_pub_ids = [e.account_user_id for e in transaction_in.debits + transaction_in.credits if
                             e.account_user_id is not None]
-    id_map = get_account_users_pub_id_to_id_map(db, auth_user, account_user_pub_ids)
+    id_map = await get_account_users_pub_id_to_id_map(db, auth_user, account_user_pub_ids)
 
     transaction.name = transaction_in.name
     transaction.date = min(e.date for e in transaction_in.debits + transaction_in.credits)
@@ -117,6 +372,10 @@ def update_transaction(
 
     old_entries = {e.pub_id: e for e in transaction.entries}
     new_entry_ids = set()
+    new_entries = []
+
+    deltas = RollupDeltas()
+    deltas.remove_entries(transaction.entries)
 
     def iterate_incoming_entries(entries: list[TransactionEntryUpdate], is_credit: bool):
         for e in entries:
@@ -126,14 +385,17 @@ def update_transaction(
                 old_entries[e.id].date = e.date
                 old_entries[e.id].amount = e.amount if is_credit else -e.amount
                 old_entries[e.id].account_user_id = id_map.get(e.account_user_id, None)
+                new_entries.append(old_entries[e.id])
             else:
-                db.add(TransactionEntry(
+                new_entry = TransactionEntry(
                     pub_id=e.id,
                     date=e.date,
                     amount=e.amount if is_credit else -e.amount,
                     transaction_id=transaction.id,
                     account_user_id=id_map.get(e.account_user_id, None),
-                ))
+                )
+                db.add(new_entry)
+                new_entries.append(new_entry)
             new_entry_ids.add(e.id)
 
     iterate_incoming_entries(transaction_in.debits, False)
@@ -142,31 +404,40 @@ def update_transaction(
     for eid, old_entry in old_entries.items():
         # iterate to delete entries
         if eid not in new_entry_ids:
-            db.delete(old_entry)
+            await db.delete(old_entry)
+
+    deltas.add_entries(new_entries)
 
     db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
+    await apply_rollup_deltas(db, deltas)
+    await bump_data_version(db, auth_user.id)
+    await db.commit()
 
-    return map_transaction(transaction)
+    return await reload_transaction(db, auth_user, transaction)
 
 
-def upsert_transaction(
-        db: Session,
+async def upsert_transaction(
+        db: AsyncSession,
         auth_user: AuthUser,
         id: str,
         transaction: TransactionUpdate
 ) -> TransactionRead:
-    transaction_raw = get_raw_transaction_or_none_by_id(db, auth_user, id)
-    return create_transaction(db, auth_user, transaction) \
+    transaction_raw = await get_raw_transaction_or_none_by_id(db, auth_user, id)
+    return await create_transaction(db, auth_user, transaction) \
         if not transaction_raw \
-        else update_transaction(db, auth_user, transaction_raw, transaction)
+        else await update_transaction(db, auth_user, transaction_raw, transaction)
+
+
+async def delete_transaction(db: AsyncSession, auth_user: AuthUser, id: str):
+    transaction_raw = await get_raw_transaction_by_id(db, auth_user, id)
 
+    deltas = RollupDeltas()
+    deltas.remove_entries(transaction_raw.entries)
 
-def delete_transaction(db: Session, auth_user: AuthUser, id: str):
-    transaction_raw = get_raw_transaction_by_id(db, auth_user, id)
-    db.delete(transaction_raw)
-    db.commit()
+    await db.delete(transaction_raw)
+    await apply_rollup_deltas(db, deltas)
+    await bump_data_version(db, auth_user.id)
+    await db.commit()
 
 
 def aggregate_entries(entries: Iterable[TransactionEntry]) -> list[TimeSeries]:
@@ -178,24 +449,299 @@ def aggregate_entries(entries: Iterable[TransactionEntry]) -> list[TimeSeries]:
         prev_cum = agg[-1].cumulative if agg else 0
         agg.append(TimeSeries(
             date=date,
-            amount=curr_amount,
-            cumulative=prev_cum + curr_amount
+            amount=Cents(curr_amount),
+            cumulative=Cents(prev_cum + curr_amount)
         ))
 
     return agg
 
 
-def get_transactions_by_account_id(db: Session, auth_user: AuthUser, account_id: str) -> list[TransactionRead]:
+def balance_series_stmt(
+        criteria: tuple[ColumnElement[bool], ...],
+        start: date | None,
+        end: date | None,
+        granularity: Granularity,
+        by_account_user: bool,
+) -> Select:
+    """
+    Sums the daily rollup of account users matching `criteria` into one row per `granularity` bucket
+    between `start` and `end`, labeled by the first day of the bucket. Days before `start` are folded
+    into a single opening row that only seeds the cumulative value, so a window continues the full series.
+    """
+    bucket = DailyBalance.date if granularity == 'day' else \
+        cast(func.date_trunc(granularity, DailyBalance.date), Date)
+    if start:
+        bucket = case((DailyBalance.date < start, literal(date.min)), else_=bucket)
+
+    partition = [DailyBalance.account_user_id] if by_account_user else []
+    # sums of bigint are numeric, so they are cast back to stay ints
+    amount = cast(func.sum(DailyBalance.amount), BigInteger)
+    series = (select(*partition,
+                     bucket.label('date'),
+                     amount.label('amount'),
+                     cast(func.sum(amount).over(partition_by=partition or None, order_by=bucket), BigInteger)
+                     .label('cumulative'))
+              .join(AccountUser)
+              .join(Account)
+              .where(*criteria)
+              .group_by(*partition, bucket))
+
+    if end:
+        series = series.where(DailyBalance.date <= end)
+
+    series = series.subquery()
+    return (select(*(series.c[c.key] for c in partition), series.c.date, series.c.amount, series.c.cumulative)
+            .where(series.c.date > date.min)
+            .order_by(*(series.c[c.key] for c in partition), series.c.date))
+
+
+async def get_balance_series(
+        db: AsyncSession,
+        *criteria: ColumnElement[bool],
+        start: date | None = None,
+        end: date | None = None,
+        granularity: Granularity = 'day',
+) -> list[TimeSeries]:
+    """
+    Same as `aggregate_entries` over the entries of account users matching `criteria`, but
+    summed from the daily rollup and accumulated in SQL so only one row per bucket is returned.
+    """
+    stmt = balance_series_stmt(criteria, start, end, granularity, by_account_user=False)
+
+    return [TimeSeries(date=d, amount=Cents(a), cumulative=Cents(c)) for d, a, c in (await db.exec(stmt)).all()]
+
+
+async def get_balance_series_by_account_user(
+        db: AsyncSession,
+        *criteria: ColumnElement[bool],
+        start: date | None = None,
+        end: date | None = None,
+        granularity: Granularity = 'day',
+) -> dict[int, list[TimeSeries]]:
+    """Same as `get_balance_series`, but with a separate series per account user id."""
+    stmt = balance_series_stmt(criteria, start, end, granularity, by_account_user=True)
+
+    series = {}
+    for account_user_id, d, a, c in (await db.exec(stmt)).all():
+        series.setdefault(account_user_id, []).append(TimeSeries(date=d, amount=Cents(a), cumulative=Cents(c)))
+
+    return series
+
+
+async def get_balance_as_of(db: AsyncSession, *criteria: ColumnElement[bool], as_of: date) -> int:
+    """
+    Sums the daily rollup up to `as_of` of account users matching `criteria` into their balance on that
+    day, reading one row per day with entries rather than every entry.
+    """
+    stmt = (select(cast(func.coalesce(func.sum(DailyBalance.amount), 0), BigInteger))
+            .join(AccountUser)
+            .join(Account)
+            .where(*criteria, DailyBalance.date <= as_of))
+
+    return (await db.exec(stmt)).one()
+
+
+async def get_balance_as_of_by_account_user(
+        db: AsyncSession,
+        *criteria: ColumnElement[bool],
+        as_of: date
+) -> dict[int, int]:
+    """Same as `get_balance_as_of`, but with a separate balance per account user id."""
+    stmt = (select(DailyBalance.account_user_id, cast(func.sum(DailyBalance.amount), BigInteger))
+            .join(AccountUser)
+            .join(Account)
+            .where(*criteria, DailyBalance.date <= as_of)
+            .group_by(DailyBalance.account_user_id))
+
+    return dict((await db.exec(stmt)).all())
+
+
+async def get_transactions_by_account_id(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        account_id: str,
+        limit: int | None = None,
+        cursor: str | None = None,
+) -> (list[TransactionRead], str | None):
+    # filter with a subquery rather than a join so each transaction counts once towards `limit`
+    account_transaction_ids = (
+        select(TransactionEntry.transaction_id)
+        .join(AccountUser)
+        .join(Account)
+        .where(Account.pub_id == account_id)
+    )
     stmt = (
         select(Transaction)
-        .order_by(Transaction.date.desc())
-        .join(Transaction.entries)
+        .options(load_transaction_entries())
+        .where(Transaction.owner_id == auth_user.id)
+        .where(Transaction.id.in_(account_transaction_ids))
+    )
+    stmt = paginate_transactions_stmt(stmt, limit, cursor)
+
+    transactions, next_cursor = page_transactions((await db.exec(stmt)).unique().all(), limit)
+
+    return [map_transaction(t, amount_relative_to_account=account_id) for t in transactions], next_cursor
+
+
+class TransactionRow(NamedTuple):
+    id: int
+    pub_id: str
+    name: str
+    date: date
+    entries: list[Row]
+
+
+def get_transaction_rows_stmt(page: Select) -> Select:
+    """
+    Selects the columns `map_transaction_row` reads for the transactions of `page`, one row per
+    entry, ordered like the ORM loads them.
+    """
+    page = page.subquery()
+    return (select(page.c.id, page.c.pub_id, page.c.name, page.c.date,
+                   TransactionEntry.pub_id.label('entry_id'),
+                   TransactionEntry.date.label('entry_date'),
+                   TransactionEntry.amount,
+                   AccountUser.pub_id.label('account_user_id'),
+                   Account.pub_id.label('account_id'),
+                   Account.is_merchant)
+            .select_from(page)
+            .join(TransactionEntry, TransactionEntry.transaction_id == page.c.id)
+            .outerjoin(AccountUser, TransactionEntry.account_user_id == AccountUser.id)
+            .outerjoin(Account, AccountUser.account_id == Account.id)
+            .order_by(page.c.date.desc(), page.c.id.desc(), TransactionEntry.date, TransactionEntry.id))
+
+
+async def get_transaction_rows(
+        db: AsyncSession,
+        stmt: Select,
+        limit: int | None = None,
+        cursor: str | None = None,
+) -> (list[TransactionRow], str | None):
+    """Pages the transactions selected by `stmt` like `get_all_transactions` in one query, as plain rows."""
+    stmt = paginate_transactions_stmt(stmt, limit, cursor)
+    rows = (await db.exec(get_transaction_rows_stmt(stmt))).all()
+    transactions = [TransactionRow(*key, list(entries)) for key, entries in groupby(rows, key=itemgetter(0, 1, 2, 3))]
+    return page_transactions(transactions, limit)
+
+
+def map_entry_row(e: Row) -> dict:
+    return {
+        'date': e.entry_date.isoformat(),
+        'amount': to_dollars(abs(e.amount)),
+        'accountUserId': e.account_user_id,
+        'id': e.entry_id,
+    }
+
+
+def map_transaction_row(transaction: TransactionRow, amount_relative_to_account: str = None) -> dict:
+    """Same as `map_transaction`, but to a dict shaped like serialized `TransactionRead`."""
+    return {
+        'name': transaction.name,
+        'debits': [map_entry_row(e) for e in transaction.entries if e.amount < 0],
+        'credits': [map_entry_row(e) for e in transaction.entries if e.amount >= 0],
+        'id': transaction.pub_id,
+        'date': min(e.entry_date for e in transaction.entries).isoformat(),
+        'amount': to_dollars(sum(
+            e.amount for e in transaction.entries
+            if e.account_user_id
+            and not e.is_merchant
+            and (e.account_id == amount_relative_to_account if amount_relative_to_account else True)
+        )),
+    }
+
+
+def select_transaction_row_keys():
+    return select(Transaction.id, Transaction.pub_id, Transaction.name, Transaction.date)
+
+
+async def get_all_transactions_json(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        limit: int | None = None,
+        cursor: str | None = None,
+) -> (list[dict], str | None):
+    """Same as `get_all_transactions`, skipping ORM and pydantic instances."""
+    stmt = select_transaction_row_keys().where(Transaction.owner_id == auth_user.id)
+    transactions, next_cursor = await get_transaction_rows(db, stmt, limit, cursor)
+    return [map_transaction_row(t) for t in transactions], next_cursor
+
+
+async def get_transactions_by_account_id_json(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        account_id: str,
+        limit: int | None = None,
+        cursor: str | None = None,
+) -> (list[dict], str | None):
+    """Same as `get_transactions_by_account_id`, skipping ORM and pydantic instances."""
+    account_transaction_ids = (
+        select(TransactionEntry.transaction_id)
         .join(AccountUser)
         .join(Account)
-        .where(Transaction.owner_id == auth_user.id)
         .where(Account.pub_id == account_id)
     )
+    stmt = (select_transaction_row_keys()
+            .where(Transaction.owner_id == auth_user.id)
+            .where(Transaction.id.in_(account_transaction_ids)))
+    transactions, next_cursor = await get_transaction_rows(db, stmt, limit, cursor)
+    return [map_transaction_row(t, amount_relative_to_account=account_id) for t in transactions], next_cursor
+
+
+# Transactions fetched per round trip of the export cursor
+EXPORT_BATCH_SIZE = 500
+
+EXPORT_CSV_HEADER = ['transaction_id', 'name', 'date', 'amount', 'entry_id', 'type', 'entry_date', 'entry_amount',
+                     'account_user_id']
+
+
+async def export_transactions(
+        db: AsyncSession,
+        auth_user: AuthUser,
+        account_id: str | None = None,
+) -> AsyncIterator[list[TransactionRead]]:
+    """
+    Yields all transactions from `auth_user` newest first in batches read from a server-side
+    cursor, so memory stays bounded by `EXPORT_BATCH_SIZE` regardless of history length.
+    """
+    stmt = (select(Transaction)
+            # joined collection loading cannot be combined with yield_per
+            .options(selectinload(Transaction.entries)
+                     .joinedload(TransactionEntry.account_user)
+                     .joinedload(AccountUser.account))
+            .where(Transaction.owner_id == auth_user.id)
+            .order_by(Transaction.date.desc(), Transaction.id.desc())
+            .execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+    if account_id:
+        stmt = stmt.where(Transaction.id.in_(
+            select(TransactionEntry.transaction_id)
+            .join(AccountUser)
+            .join(Account)
+            .where(Account.pub_id == account_id)
+        ))
+
+    result = await db.stream_scalars(stmt)
+    async for transactions in result.partitions():
+        # the identity map only holds weak references, so each batch is freed once mapped
+        yield [map_transaction(t, amount_relative_to_account=account_id) for t in transactions]
+
+
+def dump_transactions_ndjson(transactions: list[TransactionRead]) -> str:
+    return ''.join(t.model_dump_json(by_alias=True) + '\n' for t in transactions)
+
+
+def dump_transactions_csv(transactions: list[TransactionRead], header: bool = False) -> str:
+    """Flattens `transactions` to one CSV row per entry, with debits and credits as positive amounts."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if header:
+        writer.writerow(EXPORT_CSV_HEADER)
 
-    transactions = db.exec(stmt).unique().all()
+    for t in transactions:
+        for entry_type, entries in (('debit', t.debits), ('credit', t.credits)):
+            for e in entries:
+                writer.writerow([t.id, t.name, t.date, to_dollars(t.amount), e.id, entry_type, e.date,
+                                 to_dollars(e.amount), e.account_user_id])
 
-    return [map_transaction(t, amount_relative_to_account=account_id) for t in transactions]
+    return buffer.getvalue()
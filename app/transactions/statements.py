@@ -0,0 +1,157 @@
+"""
+Incremental parsers for bank statement exports, reading the upload chunk by chunk so that only the
+row being parsed is held in memory. Rows longer than `MAX_ROW_LENGTH` are rejected rather than buffered.
+"""
+import codecs
+import csv
+import html
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import AsyncIterator, NamedTuple
+
+from app.base.models import MAX_DOLLARS
+
+
+class InvalidStatement(ValueError):
+    pass
+
+
+class StatementRow(NamedTuple):
+    date: date
+    name: str
+    # in cents, positive when money goes into the account, negative when it goes out
+    amount: int
+
+
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y', '%Y%m%d')
+DATE_COLUMNS = ('date', 'posted date', 'posting date', 'transaction date')
+NAME_COLUMNS = ('name', 'description', 'payee', 'memo')
+
+# characters a single CSV record or OFX transaction may span
+MAX_ROW_LENGTH = 64 * 1024
+
+OFX_TRANSACTION = re.compile(r'<STMTTRN>(.*?)</STMTTRN>', re.IGNORECASE | re.DOTALL)
+OFX_FIELD = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+
+async def decode_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    async for chunk in chunks:
+        if text := decoder.decode(chunk):
+            yield text
+    if text := decoder.decode(b'', final=True):
+        yield text
+
+
+async def decode_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = ''
+    async for text in decode_chunks(chunks):
+        *lines, buffer = (buffer + text).split('\n')
+        for line in lines:
+            yield line.removesuffix('\r')
+        if len(buffer) > MAX_ROW_LENGTH:
+            raise InvalidStatement(f'Line longer than {MAX_ROW_LENGTH} characters')
+    if buffer:
+        yield buffer.removesuffix('\r')
+
+
+def parse_date(value: str) -> date:
+    for format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), format).date()
+        except ValueError:
+            pass
+    raise InvalidStatement(f'Invalid date {value!r}')
+
+
+def parse_amount(value: str) -> int:
+    """Parses a dollar amount into cents."""
+    value = value.strip().replace(',', '').replace('$', '')
+    if not value:
+        return 0
+    negative = value.startswith('(') and value.endswith(')')
+    try:
+        cents = Decimal(value.strip('()')) * 100
+    except InvalidOperation:
+        raise InvalidStatement(f'Invalid amount {value!r}')
+    if not cents.is_finite() or cents != cents.to_integral_value() or abs(cents) > MAX_DOLLARS * 100:
+        raise InvalidStatement(f'Invalid amount {value!r}')
+    return -int(cents) if negative else int(cents)
+
+
+def find_column(header: list[str], names: tuple[str, ...]) -> int | None:
+    return next((i for i, column in enumerate(header) if column in names), None)
+
+
+async def parse_csv_statement(chunks: AsyncIterator[bytes]) -> AsyncIterator[StatementRow]:
+    """
+    Parses a CSV export with a header row naming a date, a description and either a signed
+    `amount` column or separate `debit` and `credit` columns.
+    """
+    header = None
+    pending = None
+    async for line in decode_lines(chunks):
+        # a quoted field may span lines, so wait until its closing quote comes in
+        pending = line if pending is None else f'{pending}\n{line}'
+        if len(pending) > MAX_ROW_LENGTH:
+            raise InvalidStatement(f'Record longer than {MAX_ROW_LENGTH} characters')
+        if pending.count('"') % 2:
+            continue
+        record, pending = next(csv.reader([pending]), []), None
+        if not any(field.strip() for field in record):
+            continue
+
+        if header is None:
+            header = [column.strip().lower() for column in record]
+            date_column = find_column(header, DATE_COLUMNS)
+            name_column = find_column(header, NAME_COLUMNS)
+            amount_column = find_column(header, ('amount',))
+            debit_column = find_column(header, ('debit',))
+            credit_column = find_column(header, ('credit',))
+            if date_column is None or name_column is None or \
+                    amount_column is None and (debit_column is None or credit_column is None):
+                raise InvalidStatement('CSV header must name a date, a description and an amount')
+            continue
+
+        if len(record) != len(header):
+            raise InvalidStatement(f'Expected {len(header)} fields, got {len(record)}')
+
+        if amount_column is not None:
+            amount = parse_amount(record[amount_column])
+        else:
+            amount = parse_amount(record[credit_column]) - abs(parse_amount(record[debit_column]))
+
+        yield StatementRow(parse_date(record[date_column]), record[name_column].strip(), amount)
+
+    if pending is not None:
+        raise InvalidStatement('Unterminated quoted field')
+
+
+def parse_ofx_transaction(block: str) -> StatementRow:
+    fields = {tag.upper(): html.unescape(value.strip()) for tag, value in OFX_FIELD.findall(block)}
+    if 'DTPOSTED' not in fields or 'TRNAMT' not in fields:
+        raise InvalidStatement('OFX transaction without DTPOSTED or TRNAMT')
+    return StatementRow(
+        parse_date(fields['DTPOSTED'][:8]),
+        fields.get('NAME') or fields.get('MEMO', ''),
+        parse_amount(fields['TRNAMT'])
+    )
+
+
+async def parse_ofx_statement(chunks: AsyncIterator[bytes]) -> AsyncIterator[StatementRow]:
+    """Parses the `<STMTTRN>` aggregates of an OFX export, in either its SGML or XML flavor."""
+    buffer = ''
+    async for text in decode_chunks(chunks):
+        buffer += text
+        end = 0
+        for match in OFX_TRANSACTION.finditer(buffer):
+            yield parse_ofx_transaction(match[1])
+            end = match.end()
+        buffer = buffer[end:]
+
+        # outside a transaction only keep enough to recognize a tag split across chunks
+        start = buffer.upper().find('<STMTTRN>')
+        buffer = buffer[start:] if start >= 0 else buffer[-len('<STMTTRN>'):]
+        if len(buffer) > MAX_ROW_LENGTH:
+            raise InvalidStatement(f'Transaction longer than {MAX_ROW_LENGTH} characters')
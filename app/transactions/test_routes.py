@@ -1,9 +1,26 @@
+import asyncio
+import csv
+import io
+import json
+from copy import deepcopy
+from datetime import date, timedelta
+
 import pytest
-from starlette.status import HTTP_200_OK, HTTP_201_CREATED
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, \
+    HTTP_422_UNPROCESSABLE_ENTITY
 from starlette.testclient import TestClient
 
+from app.accounts.models import Account, AccountUser
 from app.auth.models import AuthUser
-from app.transactions.models import TransactionRead
+from app.balance.rollup import main as rollup_main
+from app.config import get_settings
+from app.db import create_db_engine, create_db_session
+from app.transactions.models import TransactionRead, TransactionUpdate
+from app.transactions import services
+from app.transactions.services import EXPORT_CSV_HEADER, get_raw_transaction_by_id, update_transaction
+from app.transactions.statements import StatementRow
 
 
 @pytest.fixture
@@ -56,6 +73,84 @@ class TestGetAll:
         assert_transaction(data[0], transaction)
 
 
+    def test_get_all_paginated(self, client: TestClient, auth_user: AuthUser, init_accounts, transaction):
+        accounts = client.get('/accounts').json()
+        for day in ('2025-05-01', '2025-05-03', '2025-05-03', '2025-05-02'):
+            for e in transaction['debits'] + transaction['credits']:
+                e['date'] = day
+                e['accountUserId'] = accounts[0]['users'][0]['id']
+            client.post('/transactions', json=transaction)
+
+        response = client.get('/transactions', params={'limit': 3})
+        page1 = response.json()
+        assert response.status_code == HTTP_200_OK
+        assert [t['date'] for t in page1] == ['2025-05-03', '2025-05-03', '2025-05-02']
+
+        response = client.get('/transactions', params={'limit': 3, 'cursor': response.headers['X-Next-Cursor']})
+        page2 = response.json()
+        assert response.status_code == HTTP_200_OK
+        assert 'X-Next-Cursor' not in response.headers
+        assert [t['date'] for t in page2] == ['2025-05-01']
+
+        response = client.get('/transactions', params={'accountId': accounts[0]['id'], 'limit': 2})
+        assert len(response.json()) == 2
+        assert 'X-Next-Cursor' in response.headers
+
+    def test_get_all_same_as_get(self, client: TestClient, auth_user: AuthUser, init_accounts, transaction):
+        accounts = client.get('/accounts').json()
+        merchant = client.put('/accounts/merchant', json={
+            'name': 'Merchant', 'isMerchant': True, 'users': [{'name': 'Merchant', 'mask': '9'}]
+        }).json()
+        transaction['debits'][0]['accountUserId'] = accounts[0]['users'][0]['id']
+        transaction['credits'][0]['accountUserId'] = merchant['users'][0]['id']
+        client.post('/transactions', json=transaction)
+        transaction['credits'].append({**transaction['credits'][0], 'date': '2025-01-01', 'accountUserId': None})
+        client.post('/transactions', json=transaction)
+
+        # listings are built without the ORM, but read the same as single transactions
+        response = client.get('/transactions')
+        assert response.status_code == HTTP_200_OK
+        for t in response.json():
+            response = client.get(f'/transactions/{t['id']}')
+            assert response.json() == t
+            assert response.content == json.dumps(t, separators=(',', ':')).encode()
+
+    def test_get_all_invalid_cursor(self, client: TestClient, auth_user: AuthUser):
+        response = client.get('/transactions', params={'limit': 1, 'cursor': 'peepeepoopoo'})
+        assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+class TestExport:
+    @pytest.fixture
+    def created(self, client: TestClient, init_accounts, transaction):
+        accounts = client.get('/accounts').json()
+        transaction['debits'][0]['accountUserId'] = accounts[0]['users'][0]['id']
+        transaction['credits'][0]['accountUserId'] = accounts[1]['users'][0]['id']
+        return client.post('/transactions', json=transaction).json()
+
+    def test_export_ndjson(self, client: TestClient, auth_user: AuthUser, created):
+        response = client.get('/transactions/export')
+        lines = response.text.splitlines()
+        assert response.status_code == HTTP_200_OK
+        assert response.headers['Content-Type'] == 'application/x-ndjson'
+        assert [json.loads(line) for line in lines] == [created]
+
+    def test_export_csv(self, client: TestClient, auth_user: AuthUser, created):
+        response = client.get('/transactions/export', params={'format': 'csv'})
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert response.status_code == HTTP_200_OK
+        assert response.headers['Content-Type'].startswith('text/csv')
+        assert [(r['transaction_id'], r['type'], float(r['entry_amount'])) for r in rows] == [
+            (created['id'], 'debit', created['debits'][0]['amount']),
+            (created['id'], 'credit', created['credits'][0]['amount']),
+        ]
+
+    def test_export_empty_csv(self, client: TestClient, auth_user: AuthUser):
+        response = client.get('/transactions/export', params={'format': 'csv'})
+        assert response.status_code == HTTP_200_OK
+        assert response.text.splitlines() == [','.join(EXPORT_CSV_HEADER)]
+
+
 class TestCreate:
     def test_create_with_no_account_user(self, client: TestClient, auth_user: AuthUser, transaction):
         response = client.post('/transactions', json=transaction)
@@ -95,8 +190,241 @@ class TestCreate:
         assert response.headers['Location'] == f'/transactions/{data['id']}'
         assert_transaction(data, transaction)
 
+    def test_create_with_fraction_of_cent(self, client: TestClient, auth_user: AuthUser, transaction):
+        transaction['debits'][0]['amount'] = transaction['credits'][0]['amount'] = 0.001
+        response = client.post('/transactions', json=transaction)
+        assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_create_with_amount_beyond_bigint(self, client: TestClient, auth_user: AuthUser, transaction):
+        transaction['debits'][0]['amount'] = transaction['credits'][0]['amount'] = 1e20
+        response = client.post('/transactions', json=transaction)
+        assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def strip_ids(transaction):
+    return {
+        **{k: v for k, v in transaction.items() if k != 'id'},
+        'debits': [{k: v for k, v in e.items() if k != 'id'} for e in transaction['debits']],
+        'credits': [{k: v for k, v in e.items() if k != 'id'} for e in transaction['credits']],
+    }
+
+
+class TestCreateBulk:
+    def test_create_bulk(self, client: TestClient, auth_user: AuthUser, init_accounts, transaction):
+        data = client.get('/accounts').json()
+        transaction['debits'][0]['accountUserId'] = data[0]['users'][0]['id']
+        transaction['credits'][0]['accountUserId'] = data[1]['users'][0]['id']
+        empty = {'name': 'Empty', 'debits': [], 'credits': []}
+
+        response = client.post('/transactions/bulk', json=[transaction, empty, transaction])
+        data = response.json()
+
+        assert response.status_code == HTTP_201_CREATED
+        assert [r['index'] for r in data] == [0, 1, 2]
+        assert data[1]['id'] is None and data[1]['error']
+        assert data[0]['error'] is None and data[2]['error'] is None
+
+        # bulk created transactions read back like ones created one at a time
+        expected = client.post('/transactions', json=transaction).json()
+        for r in (data[0], data[2]):
+            actual = client.get(f'/transactions/{r['id']}').json()
+            assert actual['id'] == r['id']
+            assert strip_ids(actual) == strip_ids(expected)
+        assert len(client.get('/transactions').json()) == 3
+
+    def test_create_bulk_unknown_account_user(self, session: Session, client: TestClient, auth_user: AuthUser,
+                                              init_accounts, transaction):
+        session.add(AuthUser(id='other-user', name='other', email='other@adfire.com'))
+        session.flush()
+        session.add(Account(name='Theirs', owner_id='other-user',
+                            users=[AccountUser(pub_id='their-user', name='Them', mask='0000', order=0)]))
+        session.commit()
+        own, unknown, foreign = deepcopy(transaction), deepcopy(transaction), deepcopy(transaction)
+        own['debits'][0]['accountUserId'] = client.get('/accounts').json()[0]['users'][0]['id']
+        unknown['debits'][0]['accountUserId'] = 'random'
+        foreign['credits'][0]['accountUserId'] = 'their-user'
+
+        data = client.post('/transactions/bulk', json=[own, unknown, foreign]).json()
+        assert data[0]['id'] and data[0]['error'] is None
+        assert data[1]['id'] is None and 'random' in data[1]['error']
+        assert data[2]['id'] is None and 'their-user' in data[2]['error']
+        assert [t['id'] for t in client.get('/transactions').json()] == [data[0]['id']]
+
+    def test_create_bulk_updates_balance(self, client: TestClient, auth_user: AuthUser, init_accounts, transaction):
+        account_user_id = client.get('/accounts').json()[0]['users'][0]['id']
+        transaction['debits'][0]['accountUserId'] = account_user_id
+        client.post('/transactions/bulk', json=[transaction, transaction])
+
+        bulk = client.get('/balance').json()
+        for r in client.get('/transactions').json():
+            client.delete(f'/transactions/{r['id']}')
+        client.post('/transactions', json=transaction)
+        client.post('/transactions', json=transaction)
+
+        assert bulk == client.get('/balance').json()
+
+
+class TestImport:
+    csv_statement = (
+        'Date,Description,Amount\n'
+        '2025-05-01,Paycheck,"1,000.00"\n'
+        '2025-05-02,"Coffee, large",-4.50\n'
+        '2025-05-02,"Coffee, large",-4.50\n'
+        '05/03/2025,Groceries,(20.25)\n'
+    )
+
+    ofx_statement = (
+        'OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n'
+        '<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250501120000<TRNAMT>1000.00<FITID>1<NAME>Paycheck</STMTTRN>\n'
+        '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20250502<TRNAMT>-4.50<FITID>2<NAME>Coffee &amp; Co</STMTTRN>\n'
+        '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+    )
+
+    @pytest.fixture
+    def account_user_id(self, client: TestClient, init_accounts):
+        return client.get('/accounts/1').json()['users'][0]['id']
+
+    def upload(self, client: TestClient, account_user_id: str, statement: str, format: str = 'csv'):
+        # chunks small enough to split rows, quoted fields and tags across reads
+        data = statement.encode()
+        chunks = (data[i:i + 7] for i in range(0, len(data), 7))
+        return client.post(f'/transactions/import?accountUserId={account_user_id}&format={format}', content=chunks)
+
+    def test_import_csv(self, client: TestClient, auth_user: AuthUser, account_user_id: str):
+        response = client.post(f'/transactions/import?accountUserId={account_user_id}', content=self.csv_statement)
+        assert response.status_code == HTTP_200_OK
+        assert response.json() == {'imported': 4, 'skipped': 0}
+
+        data = client.get('/transactions').json()
+        assert [(t['name'], t['date'], t['amount']) for t in data] == [
+            ('Groceries', '2025-05-03', -20.25),
+            ('Coffee, large', '2025-05-02', -4.5),
+            ('Coffee, large', '2025-05-02', -4.5),
+            ('Paycheck', '2025-05-01', 1000),
+        ]
+        assert data[0]['debits'][0]['accountUserId'] == account_user_id
+        assert data[0]['credits'][0]['accountUserId'] is None
+        assert data[3]['credits'][0]['accountUserId'] == account_user_id
+        assert client.get('/balance').json()['balances'][-1]['cumulative'] == 1000 - 4.5 * 2 - 20.25
+
+    def test_import_chunked(self, client: TestClient, auth_user: AuthUser, account_user_id: str):
+        response = self.upload(client, account_user_id, self.csv_statement)
+        assert response.json() == {'imported': 4, 'skipped': 0}
+
+        # the paycheck is in both statements
+        response = self.upload(client, account_user_id, self.ofx_statement, 'ofx')
+        assert response.status_code == HTTP_200_OK
+        assert response.json() == {'imported': 1, 'skipped': 1}
+        names = {t['name'] for t in client.get('/transactions').json()}
+        assert 'Coffee & Co' in names
+
+    def test_import_skips_imported_rows(self, client: TestClient, auth_user: AuthUser, account_user_id: str):
+        self.upload(client, account_user_id, self.csv_statement)
+
+        # overlaps the first upload, with a third identical coffee that is new
+        overlapping = self.csv_statement + '2025-05-02,"Coffee, large",-4.50\n2025-05-04,Rent,-800\n'
+        response = self.upload(client, account_user_id, overlapping)
+        assert response.json() == {'imported': 2, 'skipped': 4}
+        assert len(client.get('/transactions').json()) == 6
+
+    def test_import_long_statement(self, client: TestClient, auth_user: AuthUser, account_user_id: str):
+        # two identical coffees a day for over a year, more than the occurrences kept at once
+        days = [date(2024, 1, 1) + timedelta(days=i) for i in range(400)]
+        statement = 'Date,Description,Amount\n' + ''.join(f'{d},Coffee,-4.50\n' * 2 for d in days)
+
+        response = self.upload(client, account_user_id, statement)
+        assert response.json() == {'imported': 800, 'skipped': 0}
+        response = self.upload(client, account_user_id, statement)
+        assert response.json() == {'imported': 0, 'skipped': 800}
+
+    def test_import_invalid_statement(self, client: TestClient, auth_user: AuthUser, account_user_id: str):
+        response = self.upload(client, account_user_id, 'Date,Amount\n2025-05-01,1\n')
+        assert response.status_code == HTTP_400_BAD_REQUEST
+
+        response = self.upload(client, account_user_id, 'Date,Name,Amount\n2025-05-01,Paycheck,lots\n')
+        assert response.status_code == HTTP_400_BAD_REQUEST
+
+        response = self.upload(client, account_user_id, 'Date,Name,Amount\n2025-05-01,Paycheck,1.005\n')
+        assert response.status_code == HTTP_400_BAD_REQUEST
+
+        response = self.upload(client, account_user_id, 'Date,Name,Amount\n2025-05-01,Paycheck,1e20\n')
+        assert response.status_code == HTTP_400_BAD_REQUEST
+
+    def test_import_too_long_row(self, client: TestClient, auth_user: AuthUser, account_user_id: str):
+        response = self.upload(client, account_user_id, 'Date,Name,Amount\n2025-05-01,' + 'x' * 70_000 + ',-1\n')
+        assert response.status_code == HTTP_400_BAD_REQUEST
+
+        response = self.upload(client, account_user_id, 'Date,Name,Amount\n2025-05-01,"' + 'x\n' * 35_000 + '",-1\n')
+        assert response.status_code == HTTP_400_BAD_REQUEST
+
+        response = self.upload(client, account_user_id, '<OFX><STMTTRN><NAME>' + 'x' * 70_000, 'ofx')
+        assert response.status_code == HTTP_400_BAD_REQUEST
+
+    def test_import_keeps_batches_before_invalid_row(self, client: TestClient, auth_user: AuthUser,
+                                                     account_user_id: str, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(services, 'IMPORT_BATCH_SIZE', 2)
+        response = self.upload(client, account_user_id, self.csv_statement + '2025-05-04,Rent,lots\n')
+        assert response.status_code == HTTP_400_BAD_REQUEST
+        assert len(client.get('/transactions').json()) == 4
+
+        response = self.upload(client, account_user_id, self.csv_statement + '2025-05-04,Rent,-800\n')
+        assert response.json() == {'imported': 1, 'skipped': 4}
+
+    def test_import_releases_connection_while_reading(self, client: TestClient, auth_user: AuthUser,
+                                                      account_user_id: str):
+        checked_out = []
+
+        async def import_slowly():
+            engine = create_db_engine(get_settings())
+
+            async def rows():
+                for day in (1, 2):
+                    checked_out.append(engine.pool.checkedout())
+                    yield StatementRow(date(2025, 5, day), 'Coffee', -450)
+
+            async with create_db_session(engine) as db:
+                result = await services.import_transactions(db, auth_user, account_user_id, rows())
+            await engine.dispose()
+            return result
+
+        assert asyncio.run(import_slowly()).imported == 2
+        assert checked_out == [0, 0]
+
+    def test_import_nonexistent_account_user(self, client: TestClient, auth_user: AuthUser):
+        response = self.upload(client, 'random', self.csv_statement)
+        assert response.status_code == HTTP_404_NOT_FOUND
+
 
 class TestUpdate:
+    def test_update_concurrently(self, client: TestClient, auth_user: AuthUser, init_accounts, transaction):
+        transaction['debits'][0]['accountUserId'] = client.get('/accounts').json()[0]['users'][0]['id']
+        id = client.post('/transactions', json=transaction).json()['id']
+
+        def updated(amount: int) -> TransactionUpdate:
+            return TransactionUpdate.model_validate({
+                **transaction,
+                'debits': [{**transaction['debits'][0], 'amount': amount}],
+                'credits': [{**transaction['credits'][0], 'amount': amount}],
+            })
+
+        async def update(db: AsyncSession, amount: int):
+            await update_transaction(db, auth_user, await get_raw_transaction_by_id(db, auth_user, id), updated(amount))
+
+        async def race():
+            engine = create_db_engine(get_settings())
+            async with create_db_session(engine) as first, create_db_session(engine) as second:
+                locked = await get_raw_transaction_by_id(first, auth_user, id)
+                waiting = asyncio.create_task(update(second, 300))
+                await asyncio.sleep(0.2)
+                assert not waiting.done()
+                await update_transaction(first, auth_user, locked, updated(200))
+                await waiting
+            await engine.dispose()
+
+        asyncio.run(race())
+        assert client.get('/balance').json()['balances'][-1]['cumulative'] == -300
+        assert asyncio.run(rollup_main('verify', None)) == 0
+
     def test_update_update_entry_amounts(self, client: TestClient, auth_user: AuthUser, transaction):
         response = client.post('/transactions', json=transaction)
         data = response.json()
@@ -0,0 +1,236 @@
+"""
+Generates a synthetic ledger into the database from `DATABASE_URL` and bulk loads it with `COPY`, for
+benchmarks and plan checks at production volumes. Every user gets its own accounts, merchant accounts and
+transactions, with dates spread over `--days` up to `--end` and skewed towards recent ones by `--skew`,
+and a session whose token is its id followed by `-session`. The `core.daily_balance` rollup is loaded
+alongside, so it matches the entries.
+
+    python -m benchmarks.generate --users 100 --transactions 50000    # 10M entries
+    python -m benchmarks.generate --delete                             # removes what was generated
+
+Users are identified by `--prefix`, so generating again with the same prefix and seed replaces them.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+import asyncpg
+from nanoid import generate
+
+from app.config import get_settings
+from app.db import get_asyncpg_dsn
+
+# transactions generated and copied at once, bounding memory for users with many of them
+BATCH_SIZE = 50_000
+
+MERCHANT_NAMES = ['Grocer', 'Coffee', 'Fuel', 'Pharmacy', 'Airline', 'Hotel', 'Streaming', 'Utilities', 'Gym', 'Diner']
+ACCOUNT_USER_NAMES = ['John Doe', 'Jane Doe', 'Alex Doe', 'Sam Doe']
+
+
+class Options(NamedTuple):
+    users: int
+    accounts: int
+    merchants: int
+    account_users: int
+    transactions: int
+    entries: int
+    days: int
+    end: date
+    skew: float
+    prefix: str
+    seed: int
+
+
+class Ids:
+    """Consecutive ids claimed from the sequence of a table, handed out in order."""
+
+    def __init__(self, first: int):
+        self.next = first
+
+    def take(self) -> int:
+        self.next += 1
+        return self.next - 1
+
+
+async def reserve_ids(conn: asyncpg.Connection, table: str, count: int) -> Ids:
+    """Claims `count` consecutive ids from the sequence of `core.<table>.id`."""
+    sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, 'id')", f'core.{table}')
+    last = await conn.fetchval('SELECT setval($1::regclass, nextval($1::regclass) + $2 - 1)', sequence, count)
+    return Ids(last - count + 1)
+
+
+class LedgerGenerator:
+    def __init__(self, options: Options):
+        self.options = options
+        self.rng = random.Random(options.seed)
+
+    def random_date(self) -> date:
+        # uniform at a skew of 1, increasingly concentrated on recent days above it
+        days_ago = int(self.options.days * (1 - self.rng.random() ** self.options.skew))
+        return self.options.end - timedelta(days=min(days_ago, self.options.days - 1))
+
+    def random_amount(self) -> int:
+        """Returns an amount in cents."""
+        return max(1, round(self.rng.lognormvariate(3, 1.2) * 100))
+
+    def accounts(self, user_id: str, account_ids: Ids, account_user_ids: Ids) -> (list, list, list[int], list[int]):
+        """Returns account and account user records, and the account user ids of accounts and merchants."""
+        accounts, account_users, owned, merchants = [], [], [], []
+        for i in range(self.options.accounts + self.options.merchants):
+            is_merchant = i >= self.options.accounts
+            account_id = account_ids.take()
+            if is_merchant:
+                n = i - self.options.accounts
+                name = f'{MERCHANT_NAMES[n % len(MERCHANT_NAMES)]} {n}'
+            else:
+                name = f'Account {i}'
+            accounts.append((account_id, generate(), name, is_merchant, user_id))
+
+            for order in range(1 if is_merchant else self.options.account_users):
+                account_user_id = account_user_ids.take()
+                names = [name] if is_merchant else ACCOUNT_USER_NAMES
+                account_users.append((account_user_id, generate(), names[order % len(names)], f'{order:04}', order,
+                                      account_id))
+                (merchants if is_merchant else owned).append(account_user_id)
+        return accounts, account_users, owned, merchants
+
+    def transactions(self, user_id: str, count: int, owned: list[int], merchants: list[int], transaction_ids: Ids,
+                     entry_ids: Ids, rollup: dict) -> (list, list):
+        """
+        Returns transaction and entry records, mostly purchases from merchants split over the debits, and
+        otherwise transfers between accounts of the user. Adds the entries to `rollup`.
+        """
+        transactions, entries = [], []
+        debit_count = self.options.entries - 1
+        for _ in range(count):
+            transaction_id = transaction_ids.take()
+            day = self.random_date()
+            is_transfer = not merchants or self.rng.random() < 0.1
+            debits = [self.random_amount() for _ in range(debit_count)]
+            amount = sum(debits)
+
+            # (date, amount, account user) of each entry, debits negative
+            lines = [(day, -a, self.rng.choice(owned)) for a in debits]
+            settled = min(day + timedelta(days=self.rng.choice((0, 0, 0, 1, 2))), self.options.end)
+            lines.append((settled, amount, self.rng.choice(owned if is_transfer else merchants)))
+
+            name = 'Transfer' if is_transfer else 'Purchase'
+            transactions.append((transaction_id, generate(), f'{name} {transaction_id}', day, amount, user_id))
+            for entry_date, entry_amount, account_user_id in lines:
+                entries.append((entry_ids.take(), generate(), entry_date, entry_amount, transaction_id,
+                                account_user_id))
+                key = (account_user_id, entry_date)
+                rollup[key][0] += entry_amount
+                rollup[key][1] += 1
+        return transactions, entries
+
+
+async def delete_users(conn: asyncpg.Connection, prefix: str) -> int:
+    """Deletes the users generated with `prefix` and, by cascade, their ledgers."""
+    pattern = f'{prefix}-%'
+    await conn.execute('DELETE FROM authjs.session WHERE user_id LIKE $1', pattern)
+    result = await conn.execute('DELETE FROM authjs.user WHERE id LIKE $1', pattern)
+    return int(result.split()[-1])
+
+
+async def copy(conn: asyncpg.Connection, schema: str, table: str, columns: list[str], records: list):
+    await conn.copy_records_to_table(table, schema_name=schema, columns=columns, records=records)
+
+
+async def load_user(conn: asyncpg.Connection, generator: LedgerGenerator, user_id: str) -> int:
+    """Generates and loads the ledger of `user_id` in one transaction, and returns its entry count."""
+    o = generator.options
+    account_count = o.accounts + o.merchants
+    account_user_count = o.accounts * o.account_users + o.merchants
+    entry_count = o.transactions * o.entries
+
+    async with conn.transaction():
+        await copy(conn, 'authjs', 'user', ['id', 'name', 'email'],
+                   [(user_id, user_id, f'{user_id}@example.com')])
+        await copy(conn, 'authjs', 'session', ['id', 'session_token', 'expires', 'user_id'],
+                   [(f'{user_id}-session', f'{user_id}-session', datetime.now() + timedelta(days=30), user_id)])
+
+        accounts, account_users, owned, merchants = generator.accounts(
+            user_id, await reserve_ids(conn, 'account', account_count),
+            await reserve_ids(conn, 'account_user', account_user_count))
+        await copy(conn, 'core', 'account', ['id', 'pub_id', 'name', 'is_merchant', 'owner_id'], accounts)
+        await copy(conn, 'core', 'account_user', ['id', 'pub_id', 'name', 'mask', 'order', 'account_id'],
+                   account_users)
+
+        if o.transactions:
+            transaction_ids = await reserve_ids(conn, 'transaction', o.transactions)
+            entry_ids = await reserve_ids(conn, 'transaction_entry', entry_count)
+            rollup = defaultdict(lambda: [0, 0])
+            for offset in range(0, o.transactions, BATCH_SIZE):
+                transactions, entries = generator.transactions(
+                    user_id, min(BATCH_SIZE, o.transactions - offset), owned, merchants, transaction_ids, entry_ids,
+                    rollup)
+                await copy(conn, 'core', 'transaction', ['id', 'pub_id', 'name', 'date', 'amount', 'owner_id'],
+                           transactions)
+                await copy(conn, 'core', 'transaction_entry',
+                           ['id', 'pub_id', 'date', 'amount', 'transaction_id', 'account_user_id'], entries)
+
+            await copy(conn, 'core', 'daily_balance', ['account_user_id', 'date', 'amount', 'entry_count'],
+                       [(account_user_id, d, amount, n) for (account_user_id, d), (amount, n) in rollup.items()])
+
+    return entry_count
+
+
+async def main(options: Options, delete: bool, database_url: str):
+    conn = await asyncpg.connect(get_asyncpg_dsn(database_url))
+    try:
+        deleted = await delete_users(conn, options.prefix)
+        if deleted:
+            print(f'Deleted {deleted} users generated with prefix {options.prefix!r}')
+        if delete:
+            return
+
+        generator = LedgerGenerator(options)
+        started = time.perf_counter()
+        entries = 0
+        for i in range(options.users):
+            entries += await load_user(conn, generator, f'{options.prefix}-{i}')
+            elapsed = time.perf_counter() - started
+            print(f'\rLoaded {i + 1}/{options.users} users, {entries:,} entries, {entries / elapsed:,.0f}/s',
+                  end='', flush=True)
+        print()
+
+        # plans chosen before statistics catch up with the load would not reflect it
+        await conn.execute('ANALYZE authjs.user, authjs.session, core.account, core.account_user, core.transaction, '
+                           'core.transaction_entry, core.daily_balance')
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--accounts', type=int, default=5, help='non-merchant accounts per user')
+    parser.add_argument('--merchants', type=int, default=20, help='merchant accounts per user')
+    parser.add_argument('--account-users', type=int, default=2, help='account users per non-merchant account')
+    parser.add_argument('--transactions', type=int, default=10_000, help='transactions per user')
+    parser.add_argument('--entries', type=int, default=2, help='entries per transaction, one of them the credit')
+    parser.add_argument('--days', type=int, default=730, help='days spanned by transaction dates')
+    parser.add_argument('--end', type=date.fromisoformat, default=date.today(), help='last transaction date')
+    parser.add_argument('--skew', type=float, default=1.5, help='concentration of dates on recent days, 1 is uniform')
+    parser.add_argument('--prefix', default='synthetic', help='prefix of generated user ids')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--delete', action='store_true', help='only delete the users generated with --prefix')
+    parser.add_argument('--database-url', default=None, help='defaults to DATABASE_URL')
+    args = parser.parse_args()
+
+    if args.entries < 2:
+        parser.error('--entries must be at least 2')
+    if args.accounts < 1 or args.account_users < 1:
+        parser.error('--accounts and --account-users must be at least 1')
+
+    asyncio.run(main(
+        Options(args.users, args.accounts, args.merchants, args.account_users, args.transactions, args.entries,
+                args.days, args.end, args.skew, args.prefix, args.seed),
+        args.delete,
+        args.database_url or get_settings().database_url,
+    ))
@@ -0,0 +1,119 @@
+"""
+Compares the ORM read path of account and transaction listings with the plain row one they use now,
+from query to rendered JSON body, per listed row.
+
+Seeds a throwaway user in the database from `DATABASE_URL` and deletes it afterwards:
+
+    python -m benchmarks.read_path --accounts 200 --transactions 5000 --repeat 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import date, timedelta
+
+from pydantic import TypeAdapter
+from sqlalchemy import delete
+from starlette.responses import JSONResponse
+
+from app.accounts.models import AccountRead, AccountBulkUpdate, AccountUserUpdate
+from app.accounts.services import get_all_accounts, get_all_accounts_json, upsert_accounts
+from app.auth.models import AuthUser
+from app.config import get_settings
+from app.db import create_db_engine, create_db_session
+from app.transactions.models import TransactionRead, TransactionCreate, TransactionEntryCreate
+from app.transactions.services import get_all_transactions, get_all_transactions_json, create_transactions
+
+BENCHMARK_USER_ID = 'benchmark-read-path'
+
+
+def render_models(adapter: TypeAdapter, data) -> bytes:
+    # what FastAPI does with a returned value: validate it against the response model, then dump it
+    content = adapter.dump_python(adapter.validate_python(data, from_attributes=True), mode='json', by_alias=True)
+    return JSONResponse(content).body
+
+
+def render_rows(data) -> bytes:
+    return JSONResponse(data).body
+
+
+async def seed(db, auth_user: AuthUser, accounts: int, transactions: int):
+    db.add(AuthUser(id=auth_user.id, name='Benchmark'))
+    await db.commit()
+
+    results = await upsert_accounts(db, auth_user, [AccountBulkUpdate(
+        id=f'{auth_user.id}-{i}',
+        name=f'Account {i}',
+        is_merchant=i % 4 == 0,
+        users=[AccountUserUpdate(name='John Doe', mask='0'), AccountUserUpdate(name='Jane Doe', mask='1')],
+    ) for i in range(accounts)])
+    user_ids = [u.id for r in results for u in r.account.users]
+
+    start = date(2020, 1, 1)
+    for offset in range(0, transactions, 1000):
+        await create_transactions(db, auth_user, [TransactionCreate(
+            name=f'Transaction {i}',
+            debits=[TransactionEntryCreate(date=start + timedelta(days=i // 10), amount=10 + i % 90,
+                                           account_user_id=user_ids[i % len(user_ids)])],
+            credits=[TransactionEntryCreate(date=start + timedelta(days=i // 10), amount=10 + i % 90,
+                                            account_user_id=user_ids[(i * 7 + 1) % len(user_ids)])],
+        ) for i in range(offset, min(offset + 1000, transactions))])
+
+
+async def listing(read) -> list:
+    # transaction listings also return the cursor of their next page
+    data = await read
+    return data[0] if isinstance(data, tuple) else data
+
+
+async def measure(repeat: int, read, render) -> (float, bytes):
+    """Returns the median seconds of `repeat` reads rendered to a body, and the last body."""
+    timings = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        body = render(await read())
+        timings.append(time.perf_counter() - t)
+    return statistics.median(timings), body
+
+
+async def main(accounts: int, transactions: int, repeat: int):
+    engine = create_db_engine(get_settings())
+    auth_user = AuthUser(id=BENCHMARK_USER_ID)
+    try:
+        async with create_db_session(engine) as db:
+            await db.exec(delete(AuthUser).where(AuthUser.id == auth_user.id))
+            await seed(db, auth_user, accounts, transactions)
+
+            cases = [
+                ('accounts', TypeAdapter(list[AccountRead]),
+                 lambda: listing(get_all_accounts(db, auth_user, include_merchants=True)),
+                 lambda: listing(get_all_accounts_json(db, auth_user, include_merchants=True))),
+                ('transactions', TypeAdapter(list[TransactionRead]),
+                 lambda: listing(get_all_transactions(db, auth_user)),
+                 lambda: listing(get_all_transactions_json(db, auth_user))),
+            ]
+
+            print(f'{"listing":<14}{"rows":>8}{"orm ms":>10}{"rows ms":>10}{"orm us/row":>12}{"rows us/row":>13}'
+                  f'{"speedup":>9}')
+            for name, adapter, read_models, read_rows in cases:
+                orm, orm_body = await measure(repeat, read_models, lambda data: render_models(adapter, data))
+                rows, rows_body = await measure(repeat, read_rows, render_rows)
+                assert orm_body == rows_body, f'{name} bodies differ between read paths'
+
+                count = accounts if name == 'accounts' else transactions
+                print(f'{name:<14}{count:>8}{orm * 1e3:>10.1f}{rows * 1e3:>10.1f}{orm / count * 1e6:>12.1f}'
+                      f'{rows / count * 1e6:>13.1f}{orm / rows:>8.1f}x')
+    finally:
+        async with create_db_session(engine) as db:
+            await db.exec(delete(AuthUser).where(AuthUser.id == auth_user.id))
+            await db.commit()
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.accounts, args.transactions, args.repeat))
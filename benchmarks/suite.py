@@ -0,0 +1,277 @@
+"""
+Times the balance and transaction services, and the routes serving them through `TestClient`, against a
+seeded ledger. Reports latency percentiles, SQL statements and peak Python memory per call, and compares
+them with a stored baseline, exiting with status 1 when a case regressed.
+
+Seeds a throwaway user in the database from `DATABASE_URL` and deletes it afterwards:
+
+    python -m benchmarks.suite --save-baseline       # on the commit to compare against
+    python -m benchmarks.suite                       # on the change, flags regressions
+
+Balance routes are timed with the balance cache cleared before each call, so they measure the computation
+rather than a cache hit.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, NamedTuple
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+from starlette.testclient import TestClient
+
+from app.accounts.balance.services import get_account_balance
+from app.accounts.models import Account, AccountUser
+from app.auth.models import AuthUser, AuthSession
+from app.auth.services import SESSION_COOKIE
+from app.balance.services import get_balances, get_balance_cache
+from app.config import get_settings
+from app.db import QueryCounter, create_db_engine, create_db_session
+from app.main import app
+from app.transactions.models import TransactionEntry, TransactionCreate, TransactionEntryCreate, TransactionUpdate
+from app.transactions.services import aggregate_entries, get_all_transactions, get_transactions_by_account_id, \
+    create_transaction, update_transaction, get_raw_transaction_by_id
+from benchmarks.read_path import seed
+
+BENCHMARK_USER_ID = 'benchmark-suite'
+BENCHMARK_SESSION_TOKEN = 'benchmark-suite-session'
+BENCHMARK_ACCOUNT_ID = f'{BENCHMARK_USER_ID}-1'
+DEFAULT_BASELINE = Path(__file__).parent / 'baseline.json'
+
+
+class Result(NamedTuple):
+    p50: float
+    p95: float
+    p99: float
+    queries: float
+    peak_kib: float
+
+
+def summarize(timings: list[float], queries: int, peak: int) -> Result:
+    p = statistics.quantiles(timings, n=100, method='inclusive')
+    return Result(p50=p[49] * 1e3, p95=p[94] * 1e3, p99=p[98] * 1e3, queries=queries / len(timings),
+                  peak_kib=peak / 1024)
+
+
+def measure_peak(call: Callable[[], Any]) -> int:
+    """Returns the peak bytes allocated by Python during `call`, run once more on its own."""
+    tracemalloc.start()
+    try:
+        call()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+async def measure_peak_async(call: Callable[[], Awaitable]) -> int:
+    tracemalloc.start()
+    try:
+        await call()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def entry(day: date, amount: float, account_user_id: str) -> TransactionEntryCreate:
+    return TransactionEntryCreate(date=day, amount=amount, account_user_id=account_user_id)
+
+
+async def benchmark_services(engine: AsyncEngine, auth_user: AuthUser, repeat: int) -> dict[str, Result]:
+    results = {}
+    counter = QueryCounter(engine)
+
+    async with create_db_session(engine) as db:
+        entries = (await db.exec(
+            select(TransactionEntry).join(AccountUser).join(Account).where(Account.owner_id == auth_user.id)
+        )).all()
+        user_id = (await db.exec(
+            select(AccountUser.pub_id).join(Account).where(Account.pub_id == BENCHMARK_ACCOUNT_ID)
+        )).first()
+        day = date(2020, 1, 1)
+        transaction = TransactionCreate(name='Benchmark', debits=[entry(day, 10, user_id)],
+                                        credits=[entry(day, 10, None)])
+        transaction_id = (await create_transaction(db, auth_user, transaction)).id
+        amounts = iter(range(1, sys.maxsize))
+
+        async def update():
+            amount = next(amounts)
+            transaction_raw = await get_raw_transaction_by_id(db, auth_user, transaction_id)
+            await update_transaction(db, auth_user, transaction_raw, TransactionUpdate(
+                name='Benchmark', debits=[entry(day, amount, user_id)], credits=[entry(day, amount, None)]))
+
+        cases: dict[str, Callable[[], Awaitable]] = {
+            'get_balances': lambda: get_balances(db, auth_user),
+            'get_account_balance': lambda: get_account_balance(db, auth_user, BENCHMARK_ACCOUNT_ID),
+            'get_all_transactions': lambda: get_all_transactions(db, auth_user),
+            'get_transactions_by_account_id': lambda: get_transactions_by_account_id(db, auth_user,
+                                                                                     BENCHMARK_ACCOUNT_ID),
+            'create_transaction': lambda: create_transaction(db, auth_user, transaction),
+            'update_transaction': update,
+        }
+
+        timings = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            aggregate_entries(entries)
+            timings.append(time.perf_counter() - t)
+        results['aggregate_entries'] = summarize(timings, 0, measure_peak(lambda: aggregate_entries(entries)))
+
+        for name, call in cases.items():
+            timings = []
+            counter.statements.clear()
+            with counter.counting():
+                for _ in range(repeat):
+                    t = time.perf_counter()
+                    await call()
+                    timings.append(time.perf_counter() - t)
+                    # keep identity map state from carrying over between calls
+                    db.expunge_all()
+            results[name] = summarize(timings, counter.count, await measure_peak_async(call))
+            db.expunge_all()
+
+    return results
+
+
+def benchmark_routes(auth_user: AuthUser, repeat: int) -> dict[str, Result]:
+    results = {}
+
+    with TestClient(app, cookies={SESSION_COOKIE: BENCHMARK_SESSION_TOKEN}) as client:
+        counter = QueryCounter(client.app.state.engine)
+        user_id = client.get(f'/accounts/{BENCHMARK_ACCOUNT_ID}').json()['users'][0]['id']
+        day = '2020-01-01'
+        transaction = {'name': 'Benchmark', 'debits': [{'date': day, 'amount': 10, 'accountUserId': user_id}],
+                       'credits': [{'date': day, 'amount': 10}]}
+        transaction_id = client.post('/transactions', json=transaction).json()['id']
+        amounts = iter(range(1, sys.maxsize))
+
+        def update():
+            amount = next(amounts)
+            return client.put(f'/transactions/{transaction_id}', json={
+                'name': 'Benchmark', 'debits': [{'date': day, 'amount': amount, 'accountUserId': user_id}],
+                'credits': [{'date': day, 'amount': amount}]})
+
+        cases: dict[str, Callable[[], Any]] = {
+            'GET /balance': lambda: client.get('/balance'),
+            'GET /accounts/{id}/balance': lambda: client.get(f'/accounts/{BENCHMARK_ACCOUNT_ID}/balance'),
+            'GET /transactions': lambda: client.get('/transactions'),
+            'GET /transactions?accountId': lambda: client.get('/transactions',
+                                                              params={'accountId': BENCHMARK_ACCOUNT_ID}),
+            'POST /transactions': lambda: client.post('/transactions', json=transaction),
+            'PUT /transactions/{id}': update,
+        }
+
+        for name, call in cases.items():
+            timings = []
+            counter.statements.clear()
+            with counter.counting():
+                for _ in range(repeat):
+                    get_balance_cache().clear()
+                    t = time.perf_counter()
+                    response = call()
+                    timings.append(time.perf_counter() - t)
+                    assert response.is_success, f'{name} responded {response.status_code}'
+            get_balance_cache().clear()
+            results[name] = summarize(timings, counter.count, measure_peak(call))
+
+    return results
+
+
+def compare(results: dict[str, Result], baseline: dict[str, dict], threshold: float) -> list[str]:
+    """Returns the cases slower or heavier than in `baseline` by more than `threshold`, or with more queries."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = Result(**baseline[name])
+        for metric in ('p50', 'p95', 'p99', 'peak_kib'):
+            if getattr(result, metric) > getattr(base, metric) * (1 + threshold):
+                regressions.append(f'{name}: {metric} {getattr(base, metric):.1f} -> {getattr(result, metric):.1f}')
+        if result.queries > base.queries:
+            regressions.append(f'{name}: queries {base.queries:g} -> {result.queries:g}')
+    return regressions
+
+
+def report(results: dict[str, Result], baseline: dict[str, dict]):
+    print(f'{"case":<34}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"peak KiB":>10}{"p95 vs base":>13}')
+    for name, r in results.items():
+        change = ''
+        if name in baseline:
+            change = f'{(r.p95 / baseline[name]["p95"] - 1) * 100:+.0f}%'
+        print(f'{name:<34}{r.p50:>9.2f}{r.p95:>9.2f}{r.p99:>9.2f}{r.queries:>9g}{r.peak_kib:>10.0f}{change:>13}')
+
+
+async def setup(accounts: int, transactions: int):
+    # left behind by a run that did not finish
+    await teardown()
+    engine = create_db_engine(get_settings())
+    auth_user = AuthUser(id=BENCHMARK_USER_ID)
+    try:
+        async with create_db_session(engine) as db:
+            await seed(db, auth_user, accounts, transactions)
+            db.add(AuthSession(id=BENCHMARK_SESSION_TOKEN, session_token=BENCHMARK_SESSION_TOKEN,
+                               expires=datetime.now() + timedelta(days=1), user_id=auth_user.id))
+            await db.commit()
+    finally:
+        await engine.dispose()
+
+
+async def run_services(repeat: int) -> dict[str, Result]:
+    engine = create_db_engine(get_settings())
+    try:
+        return await benchmark_services(engine, AuthUser(id=BENCHMARK_USER_ID), repeat)
+    finally:
+        await engine.dispose()
+
+
+async def teardown():
+    engine = create_db_engine(get_settings())
+    try:
+        async with create_db_session(engine) as db:
+            await db.exec(delete(AuthSession).where(AuthSession.user_id == BENCHMARK_USER_ID))
+            await db.exec(delete(AuthUser).where(AuthUser.id == BENCHMARK_USER_ID))
+            await db.commit()
+    finally:
+        await engine.dispose()
+
+
+def main(accounts: int, transactions: int, repeat: int, baseline_path: Path, save_baseline: bool,
+         threshold: float) -> int:
+    asyncio.run(setup(accounts, transactions))
+    try:
+        results = asyncio.run(run_services(repeat))
+        results |= benchmark_routes(AuthUser(id=BENCHMARK_USER_ID), repeat)
+    finally:
+        asyncio.run(teardown())
+
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() and not save_baseline else {}
+    report(results, baseline)
+
+    if save_baseline:
+        baseline_path.write_text(json.dumps({name: r._asdict() for name, r in results.items()}, indent=2))
+        print(f'\nSaved baseline to {baseline_path}')
+        return 0
+
+    regressions = compare(results, baseline, threshold)
+    if regressions:
+        print(f'\nRegressions over {threshold:.0%}:', *regressions, sep='\n  ')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=50)
+    parser.add_argument('--transactions', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown counted as a regression')
+    args = parser.parse_args()
+    sys.exit(main(args.accounts, args.transactions, args.repeat, args.baseline, args.save_baseline, args.threshold))